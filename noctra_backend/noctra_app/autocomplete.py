@@ -0,0 +1,220 @@
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db.models.functions import Coalesce
+
+from .models import Club, UserProfile
+from .tasks import enqueue
+
+
+def fold(name):
+    # Case and accent insensitive: "Ñandú" is found by "nan"
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+class PrefixIndex:
+    """
+    In-memory type-ahead over usernames and club names: a sorted array of folded names searched
+    with bisect, so a lookup is one binary search plus a short scan, with no database access.
+    Matches are ranked by follower count. Prefixes that match more than `scan_limit` names
+    ("a", "da") are not scanned: each keeps the `top_size` best candidates per kind instead.
+
+    Signals keep it current for writes made by this process, and it is rebuilt from the database
+    every `resync_interval` seconds to pick up the other workers' writes. The server entry points
+    warm it on the worker queue at startup, and rebuilds run there too, one at a time, while
+    lookups keep using the current arrays.
+    """
+
+    def __init__(self, resync_interval, scan_limit, top_size=20):
+        self.resync_interval = resync_interval
+        self.scan_limit = scan_limit
+        self.top_size = top_size
+        self._lock = threading.Lock()
+        self._keys = []  # sorted (folded name, kind, id)
+        self._entries = {}  # (kind, id) -> [folded name, display name, followers]
+        self._top = {}  # busy prefix -> {kind: set of (kind, id)}, the most followed matches
+        self._synced_at = None
+        self._resync_lock = threading.Lock()
+        self._resync_queued = False
+
+    def warm(self):
+        # Called from wsgi.py/asgi.py so the first keystroke finds the index loaded
+        self._queue_resync()
+
+    def _ensure_fresh(self):
+        if self._synced_at is None:
+            self.resync(only_if_cold=True)  # a lookup that beats the warm-up waits for it
+        elif time.time() - self._synced_at >= self.resync_interval:
+            self._queue_resync()
+
+    def _queue_resync(self):
+        with self._lock:
+            if self._resync_queued:
+                return
+            self._resync_queued = True
+        enqueue(self._background_resync)
+
+    def _background_resync(self):
+        try:
+            self.resync()
+        finally:
+            self._resync_queued = False
+
+    def resync(self, only_if_cold=False):
+        with self._resync_lock:
+            if only_if_cold and self._synced_at is not None:
+                return  # loaded by another thread while this one waited
+            self._load()
+
+    def _load(self):
+        users = UserProfile.objects.values_list('id', 'user__username', 'followers_count')
+        clubs = Club.objects.annotate(follower_total=Coalesce('profile__followers_count', 0)).values_list(
+            'id', 'name', 'follower_total'
+        )
+        entries = {}
+        for kind, rows in (('user', users), ('club', clubs)):
+            for object_id, name, followers in rows.iterator():
+                entries[(kind, object_id)] = [fold(name), name, followers]
+        keys = sorted((folded, kind, object_id) for (kind, object_id), (folded, _, _) in entries.items())
+        top = self._busy_prefixes(keys, entries)
+        with self._lock:
+            self._entries, self._keys, self._top = entries, keys, top
+            self._synced_at = time.time()
+
+    def _busy_prefixes(self, keys, entries):
+        # Walks down from one-letter prefixes; a prefix with few enough matches has no busy extensions
+        top = {}
+        pending = [('', 0, len(keys))]
+        while pending:
+            prefix, start, end = pending.pop()
+            if end - start <= self.scan_limit:
+                continue
+            if prefix:
+                top[prefix] = {}
+                for kind in ('user', 'club'):
+                    matches = [(kind, object_id) for _, key_kind, object_id in keys[start:end] if key_kind == kind]
+                    top[prefix][kind] = set(
+                        heapq.nlargest(self.top_size, matches, key=lambda key: self._rank(entries[key]))
+                    )
+            position = start
+            while position < end:
+                folded = keys[position][0]
+                if len(folded) == len(prefix):
+                    position += 1  # the name is the prefix itself
+                    continue
+                child = folded[:len(prefix) + 1]
+                child_end = bisect_left(keys, (prefix_end(child),), position, end)
+                pending.append((child, position, child_end))
+                position = child_end
+        return top
+
+    @staticmethod
+    def _rank(entry):
+        _, name, followers = entry
+        return followers, -len(name)
+
+    def _offer(self, kind, object_id):
+        # Adds an entry to the candidates of the busy prefixes of its name it now ranks in; call with the lock held
+        entry = self._entries[(kind, object_id)]
+        folded = entry[0]
+        for length in range(1, len(folded) + 1):
+            busy = self._top.get(folded[:length])
+            if busy is None:
+                break
+            candidates = busy[kind]
+            if (kind, object_id) in candidates:
+                continue
+            if len(candidates) < self.top_size or self._rank(entry) > min(
+                self._rank(self._entries[key]) for key in candidates
+            ):
+                candidates.add((kind, object_id))
+                if len(candidates) > 2 * self.top_size:
+                    busy[kind] = set(heapq.nlargest(
+                        self.top_size, candidates, key=lambda key: self._rank(self._entries[key]),
+                    ))
+
+    def _withdraw(self, kind, object_id, folded):
+        for length in range(1, len(folded) + 1):
+            busy = self._top.get(folded[:length])
+            if busy is None:
+                break
+            busy[kind].discard((kind, object_id))
+
+    def put(self, kind, object_id, name):
+        if self._synced_at is None:
+            return  # Not warmed yet, the first lookup loads everything anyway
+        folded = fold(name)
+        with self._lock:
+            entry = self._entries.get((kind, object_id))
+            if entry is not None:
+                if entry[0] == folded:
+                    entry[1] = name
+                    return
+                self._remove_key(entry[0], kind, object_id)
+                self._withdraw(kind, object_id, entry[0])
+                entry[0], entry[1] = folded, name
+            else:
+                self._entries[(kind, object_id)] = [folded, name, 0]
+            insort(self._keys, (folded, kind, object_id))
+            self._offer(kind, object_id)
+
+    def remove(self, kind, object_id):
+        with self._lock:
+            entry = self._entries.pop((kind, object_id), None)
+            if entry is not None:
+                self._remove_key(entry[0], kind, object_id)
+                self._withdraw(kind, object_id, entry[0])
+
+    def _remove_key(self, folded, kind, object_id):
+        position = bisect_left(self._keys, (folded, kind, object_id))
+        if position < len(self._keys) and self._keys[position] == (folded, kind, object_id):
+            del self._keys[position]
+
+    def adjust_followers(self, kind, object_id, delta):
+        with self._lock:
+            entry = self._entries.get((kind, object_id))
+            if entry is not None:
+                entry[2] = max(entry[2] + delta, 0)
+                self._offer(kind, object_id)
+
+    def lookup(self, prefix, limit=8, kinds=('user', 'club')):
+        prefix = fold(prefix.strip().lstrip('@'))
+        if not prefix:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            matches = []
+            busy = self._top.get(prefix)
+            if busy is not None:
+                for kind in kinds:
+                    for key in busy.get(kind, ()):
+                        _, name, followers = self._entries[key]
+                        matches.append((followers, -len(name), kind, key[1], name))
+                return self._best(matches, limit)
+            # Names added since the last resync can push a prefix past scan_limit, the scan stops there
+            for position in range(bisect_left(self._keys, (prefix,)), len(self._keys)):
+                folded, kind, object_id = self._keys[position]
+                if not folded.startswith(prefix) or len(matches) >= self.scan_limit:
+                    break
+                if kind in kinds:
+                    _, name, followers = self._entries[(kind, object_id)]
+                    matches.append((followers, -len(name), kind, object_id, name))
+        return self._best(matches, limit)
+
+    @staticmethod
+    def _best(matches, limit):
+        best = heapq.nlargest(limit, matches)
+        return [{'type': kind, 'id': object_id, 'name': name} for _, _, kind, object_id, name in best]
+
+
+def prefix_end(prefix):
+    # The smallest string above every string that starts with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+name_index = PrefixIndex(settings.AUTOCOMPLETE_RESYNC_SECONDS, settings.AUTOCOMPLETE_SCAN_LIMIT)
@@ -0,0 +1,77 @@
+import re
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import Mention, Post, Tag
+from .notifications import notifier
+from .tags import attach_tags, normalize_tag, resolve_tags
+
+# One pass finds both kinds of token. The lookbehind skips e-mail addresses and "##",
+# handles may contain dots and dashes but not end with one ("thanks @ana." is "ana").
+CAPTION_TOKEN = re.compile(r'(?<![\w@#])([@#])(\w(?:[\w.-]*\w)?)')
+
+
+def extract_entities(caption):
+    """
+    Returns (usernames, tag names) found in a caption, first-seen order, without duplicates.
+    """
+    usernames, tags = {}, {}
+    for sigil, value in CAPTION_TOKEN.findall(caption or ''):
+        if sigil == '@':
+            usernames.setdefault(value, None)
+        else:
+            name = normalize_tag(value)
+            if len(name) <= Tag._meta.get_field('name').max_length:
+                tags.setdefault(name, None)
+    return list(usernames), list(tags)
+
+
+def process_caption(post, previous_caption=None):
+    """
+    Syncs the mentions and hashtags of a post with its caption. Only the difference to
+    `previous_caption` is written, and only newly mentioned users are notified.
+    """
+    usernames, tags = extract_entities(post.caption)
+    old_usernames, old_tags = extract_entities(previous_caption)
+
+    added_usernames = [name for name in usernames if name not in old_usernames]
+    removed_usernames = [name for name in old_usernames if name not in usernames]
+    added_tags = [name for name in tags if name not in old_tags]
+    removed_tags = [name for name in old_tags if name not in tags]
+
+    user_ids = {}
+    if added_usernames or removed_usernames:
+        user_ids = dict(
+            User.objects.filter(username__in=added_usernames + removed_usernames).values_list('username', 'id')
+        )
+    added_ids = [user_ids[name] for name in added_usernames if name in user_ids]
+    removed_ids = [user_ids[name] for name in removed_usernames if name in user_ids]
+
+    MentionLink = Post.mentions.through
+    TagLink = Post.tags.through
+    with transaction.atomic():
+        if removed_ids:
+            Mention.objects.filter(post=post, mentioned_user_id__in=removed_ids).delete()
+            MentionLink.objects.filter(post_id=post.pk, user_id__in=removed_ids).delete()
+        if removed_tags:
+            # Tags given explicitly stay, only links a hashtag added go with it
+            TagLink.objects.filter(post_id=post.pk, tag__name__in=removed_tags, from_caption=True).delete()
+
+        if added_ids:
+            # Skip users the post already mentions, e.g. when a previous caption was never processed
+            already = set(Mention.objects.filter(post=post, mentioned_user_id__in=added_ids)
+                          .values_list('mentioned_user_id', flat=True))
+            added_ids = [user_id for user_id in added_ids if user_id not in already]
+
+        if added_ids:
+            Mention.objects.bulk_create([
+                Mention(post=post, mentioned_user_id=user_id, mentioned_by_id=post.owner_id) for user_id in added_ids
+            ])
+            MentionLink.objects.bulk_create(
+                [MentionLink(post_id=post.pk, user_id=user_id) for user_id in added_ids], ignore_conflicts=True,
+            )
+            for user_id in added_ids:
+                notifier.notify(user_id, 'mention', f'post:{post.pk}', post.owner_id)
+        if added_tags:
+            attach_tags(post, resolve_tags(added_tags), from_caption=True)
@@ -0,0 +1,49 @@
+from django.db.models import Count, F, Subquery, Window
+from django.db.models.functions import RowNumber, Substr
+
+from .models import Comment
+
+
+def load_comment_tree(post_id, root_limit=None, reply_limit=None):
+    """
+    Returns the comment threads of a post as nested dicts, oldest first, in one query whatever
+    the depth: comments sorted on their materialized path come out as a depth-first walk.
+
+    root_limit keeps the first N threads and reply_limit the first K replies of each
+    (depth-first, so deeper replies come right after the one they answer).
+    Every root reports its full reply_count either way.
+    """
+    comments = Comment.objects.filter(post_id=post_id)
+    thread = Substr('path', 1, Comment.PATH_SEGMENT)
+
+    if root_limit is not None:
+        roots = Comment.objects.filter(post_id=post_id, depth=0).order_by('path').values('path')[:root_limit]
+        comments = comments.annotate(thread=thread).filter(thread__in=Subquery(roots))
+
+    comments = comments.annotate(
+        thread_size=Window(Count('id'), partition_by=thread),
+        position=Window(RowNumber(), partition_by=thread, order_by=F('path').asc()),
+    )
+    if reply_limit is not None:
+        # The root is position 1 in its own thread
+        comments = comments.filter(position__lte=reply_limit + 1)
+
+    roots = []
+    nodes = {}
+    for comment in comments.select_related('author').order_by('path'):
+        node = {
+            'id': comment.id,
+            'author': {'id': comment.author_id, 'username': comment.author.username},
+            'text': comment.text,
+            'created_at': comment.created_at,
+            'parent': comment.parent_id,
+            'depth': comment.depth,
+            'replies': [],
+        }
+        nodes[comment.id] = node
+        if comment.parent_id is None:
+            node['reply_count'] = comment.thread_size - 1
+            roots.append(node)
+        elif comment.parent_id in nodes:
+            nodes[comment.parent_id]['replies'].append(node)
+    return roots
@@ -0,0 +1,138 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from .models import ClubProfile, Follow, UserProfile
+
+# Targets are ('user', UserProfile id) or ('club', ClubProfile id), followers are UserProfile ids
+
+TARGET_FIELDS = {'user': 'following_user_id', 'club': 'following_club_id'}
+
+
+def follow_target(follow):
+    if follow.following_user_id:
+        return 'user', follow.following_user_id
+    return 'club', follow.following_club_id
+
+
+# Counters, kept by the Follow signals
+
+def _adjust(model, pk, field, delta):
+    rows = model.objects.filter(pk=pk)
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    rows.update(**{field: F(field) + delta})
+
+
+def count_follow(follow, delta):
+    kind, target_id = follow_target(follow)
+    _adjust(UserProfile, follow.follower_id, 'following_count', delta)
+    _adjust(UserProfile if kind == 'user' else ClubProfile, target_id, 'followers_count', delta)
+
+
+class AdjacencyCache:
+    """
+    Follower ids of the most followed accounts, each held as a sorted array('q'): 8 bytes per
+    edge instead of a Python int in a set, and a membership test is a binary search.
+    Accounts below `threshold` followers are cheap enough to ask the database about.
+
+    Writes made by this process update the arrays in place. Other processes' writes show up
+    once an array is older than `ttl` seconds and gets reloaded.
+    """
+
+    def __init__(self, threshold, size, ttl):
+        self.threshold = threshold
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hot = {}
+        self._hot_at = None
+        self._followers = OrderedDict()  # target -> (loaded at, array of follower ids), least recently used first
+
+    def _hot_targets(self):
+        now = time.time()
+        if self._hot_at is None or now - self._hot_at >= self.ttl:
+            hot = {}
+            for kind, model in (('user', UserProfile), ('club', ClubProfile)):
+                hot[kind] = set(
+                    model.objects.filter(followers_count__gte=self.threshold)
+                    .order_by('-followers_count').values_list('id', flat=True)[:self.size]
+                )
+            self._hot, self._hot_at = hot, now
+        return self._hot
+
+    def _follower_array(self, target):
+        now = time.time()
+        with self._lock:
+            cached = self._followers.get(target)
+            if cached and now - cached[0] < self.ttl:
+                self._followers.move_to_end(target)
+                return cached[1]
+
+        kind, target_id = target
+        ids = Follow.objects.filter(**{TARGET_FIELDS[kind]: target_id}).order_by('follower_id').values_list(
+            'follower_id', flat=True
+        )
+        followers = array('q', ids.iterator(chunk_size=10000))
+        with self._lock:
+            self._followers[target] = (now, followers)
+            self._followers.move_to_end(target)
+            while len(self._followers) > self.size:
+                self._followers.popitem(last=False)
+        return followers
+
+    def is_hot(self, target):
+        return target[1] in self._hot_targets().get(target[0], ())
+
+    def contains(self, target, follower_id):
+        followers = self._follower_array(target)
+        with self._lock:
+            position = bisect_left(followers, follower_id)
+            return position < len(followers) and followers[position] == follower_id
+
+    def update(self, target, follower_id, followed):
+        with self._lock:
+            cached = self._followers.get(target)
+            if cached is None:
+                return
+            followers = cached[1]
+            position = bisect_left(followers, follower_id)
+            present = position < len(followers) and followers[position] == follower_id
+            if followed and not present:
+                followers.insert(position, follower_id)
+            elif not followed and present:
+                del followers[position]
+
+
+adjacency = AdjacencyCache(
+    settings.FOLLOW_GRAPH_HOT_THRESHOLD, settings.FOLLOW_GRAPH_CACHE_SIZE, settings.FOLLOW_GRAPH_CACHE_SECONDS,
+)
+
+
+def is_following(follower_id, targets):
+    """
+    Batched "do I follow X" for a page of profiles: {target: bool} for (kind, id) targets.
+    Hot accounts are answered from the adjacency cache, everything else with one query.
+    """
+    result = {}
+    cold = {'user': [], 'club': []}
+    for target in dict.fromkeys(targets):
+        if adjacency.is_hot(target):
+            result[target] = adjacency.contains(target, follower_id)
+        else:
+            cold[target[0]].append(target[1])
+
+    if cold['user'] or cold['club']:
+        rows = Follow.objects.filter(follower_id=follower_id).filter(
+            Q(following_user_id__in=cold['user']) | Q(following_club_id__in=cold['club'])
+        )
+        followed = {follow_target(follow) for follow in rows.only('following_user_id', 'following_club_id')}
+        for kind, ids in cold.items():
+            for target_id in ids:
+                result[(kind, target_id)] = (kind, target_id) in followed
+    return result
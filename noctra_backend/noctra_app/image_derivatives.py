@@ -0,0 +1,43 @@
+"""
+Pure Pillow work for the derivative pipeline. It runs in a separate process, so this module
+must not import Django models or touch the database.
+"""
+import os
+
+from PIL import Image, ImageOps
+
+
+def supported_formats(formats):
+    # AVIF needs a Pillow build (or plugin) with an AVIF encoder, formats that cannot be saved are skipped
+    Image.init()
+    return [fmt for fmt in formats if fmt.upper() in Image.SAVE]
+
+
+def render_derivatives(source_path, widths, formats, quality):
+    """
+    Writes `<name>_w<width>.<format>` next to the source for each width below the original width
+    and each supported format. Returns the variants as dicts with width, format and file name.
+    """
+    stem = os.path.splitext(source_path)[0]
+    variants = []
+
+    with Image.open(source_path) as image:
+        if getattr(image, 'is_animated', False):
+            # Resizing would drop the animation, animated GIFs are served as uploaded
+            return variants
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for width in sorted(set(widths)):
+            if width >= image.width:
+                break
+            resized = image.copy()
+            resized.thumbnail((width, image.height), Image.LANCZOS)
+            for fmt in supported_formats(formats):
+                path = f'{stem}_w{width}.{fmt}'
+                if not os.path.exists(path):
+                    resized.save(path, format=fmt.upper(), quality=quality)
+                variants.append({'width': resized.width, 'format': fmt, 'file': os.path.basename(path)})
+
+    return variants
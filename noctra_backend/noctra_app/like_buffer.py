@@ -0,0 +1,108 @@
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Like, Post, live_count
+from .notifications import notifier
+from .tasks import PeriodicFlusher
+
+
+class LikeBuffer:
+    """
+    Coalesces likes and unlikes in memory and writes them in bulk.
+    Pending state is keyed by (post_id, user_id), so repeated taps collapse into the last one.
+    """
+
+    def __init__(self, interval):
+        self._lock = threading.Lock()
+        self._pending = {}  # (post_id, user_id) -> True for like, False for unlike
+        self._writing = {}  # the batch being flushed, until its transaction commits
+        self._flush_lock = threading.Lock()  # the flusher thread and the exit flush never overlap
+        self._flusher = PeriodicFlusher(self.flush, interval, 'like-buffer')
+
+    def like(self, post_id, user_id):
+        self._set(post_id, user_id, True)
+
+    def unlike(self, post_id, user_id):
+        self._set(post_id, user_id, False)
+
+    def _set(self, post_id, user_id, liked):
+        self._flusher.start()
+        with self._lock:
+            self._pending[(post_id, user_id)] = liked
+
+    def pending_state(self, post_id, user_id):
+        # True/False while a like/unlike is waiting to be flushed or being written, None otherwise
+        key = (post_id, user_id)
+        with self._lock:
+            return self._pending[key] if key in self._pending else self._writing.get(key)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._writing = pending
+            if not pending:
+                return 0
+
+            try:
+                self._write(pending)
+            except Exception:
+                # Put the batch back without overwriting anything queued since
+                with self._lock:
+                    for key, liked in pending.items():
+                        self._pending.setdefault(key, liked)
+                raise
+            finally:
+                with self._lock:
+                    self._writing = {}
+            return len(pending)
+
+    def _write(self, pending):
+        post_ids = {post_id for post_id, _ in pending}
+        user_ids = {user_id for _, user_id in pending}
+        # Rows for deleted posts/users would fail the foreign keys, not the unique index
+        post_owners = dict(Post.objects.filter(pk__in=post_ids).values_list('pk', 'owner_id'))
+        live_users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+        likes = []
+        unlikes = defaultdict(list)
+        for (post_id, user_id), liked in pending.items():
+            if post_id not in post_owners or user_id not in live_users:
+                continue
+            if liked:
+                likes.append(Like(post_id=post_id, user_id=user_id))
+            else:
+                unlikes[post_id].append(user_id)
+
+        # Only likes that are not stored yet notify the post owner
+        existing = set()
+        if likes:
+            likers = defaultdict(list)
+            for like in likes:
+                likers[like.post_id].append(like.user_id)
+            condition = Q()
+            for post_id, users in likers.items():
+                condition |= Q(post_id=post_id, user_id__in=users)
+            existing = set(Like.objects.filter(condition).values_list('post_id', 'user_id'))
+
+        with transaction.atomic():
+            Like.objects.bulk_create(likes, batch_size=500, ignore_conflicts=True)
+            if unlikes:
+                condition = Q()
+                for post_id, users in unlikes.items():
+                    condition |= Q(post_id=post_id, user_id__in=users)
+                # The recount below overrides what the per-row counter signals do
+                Like.objects.filter(condition).delete()
+            # One recount per touched post instead of one counter update per like
+            Post.objects.filter(pk__in=post_owners).update(like_count=live_count(Like, 'post'))
+            for like in likes:
+                if (like.post_id, like.user_id) not in existing:
+                    notifier.notify(post_owners[like.post_id], 'like', f'post:{like.post_id}', like.user_id)
+
+
+like_buffer = LikeBuffer(getattr(settings, 'LIKE_BUFFER_FLUSH_INTERVAL', 1.0))
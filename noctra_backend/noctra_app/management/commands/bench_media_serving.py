@@ -0,0 +1,70 @@
+import os
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.views.static import serve
+
+from noctra_app.media_serving import serve_media
+
+
+def consume(response):
+    # Drain the body the way a WSGI server without sendfile would
+    sent = 0
+    if response.streaming:
+        for chunk in response.streaming_content:
+            sent += len(chunk)
+    else:
+        sent = len(response.content)
+    response.close()
+    return sent
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and peak memory of django.views.static.serve and serve_media on a generated file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=10)
+        parser.add_argument('--range-kb', type=int, default=1024, help='Size of the seek requests')
+
+    def handle(self, *args, **options):
+        name = 'bench/0123456789abcdef0123456789abcdef.mp4'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = options['size_mb'] * 1024 * 1024
+        with open(path, 'wb') as bench_file:
+            for _ in range(options['size_mb']):
+                bench_file.write(os.urandom(1024 * 1024))
+
+        factory = RequestFactory()
+        middle = size // 2
+        seek = f"bytes={middle}-{middle + options['range_kb'] * 1024 - 1}"
+        views = {
+            'static.serve': lambda request: serve(request, name, document_root=settings.MEDIA_ROOT),
+            'serve_media': lambda request: serve_media(request, name),
+        }
+
+        try:
+            for label, headers in (('full file', {}), (f"seek {options['range_kb']} KB", {'HTTP_RANGE': seek})):
+                self.stdout.write(f'{label} ({options["requests"]} requests, {options["size_mb"]} MB file)')
+                for view_name, view in views.items():
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    sent = 0
+                    for _ in range(options['requests']):
+                        sent += consume(view(factory.get(f'/media/{name}', **headers)))
+                    elapsed = time.perf_counter() - started
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    self.stdout.write(
+                        f'  {view_name:<13} {elapsed * 1000 / options["requests"]:8.1f} ms/request  '
+                        f'{sent / elapsed / 1024 / 1024:8.0f} MB/s  {sent / options["requests"] / 1024:10.0f} KB sent/request  '
+                        f'peak {peak / 1024:8.0f} KB'
+                    )
+        finally:
+            os.remove(path)
+            if not os.listdir(os.path.dirname(path)):
+                os.rmdir(os.path.dirname(path))
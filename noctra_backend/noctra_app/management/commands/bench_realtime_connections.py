@@ -0,0 +1,73 @@
+import asyncio
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from noctra_app.pubsub import publish, publish_many
+from noctra_app.realtime import websocket_session
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold N idle push connections open in one event loop, as a single ASGI worker would, and report '
+        'the memory each one costs and how long one broadcast and one message per client take to arrive. '
+        'Runs the WebSocket session loop in-process against the configured broker, no server or database needed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=10000)
+        parser.add_argument('--idle', type=float, default=2.0, help='Seconds to leave the connections idle')
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['connections'], options['idle']))
+
+    async def run(self, count, idle):
+        received = [0]
+        everyone = asyncio.Event()
+        leave = asyncio.Event()
+        expected = [count]
+
+        async def receive():
+            await leave.wait()
+            return {'type': 'websocket.disconnect'}
+
+        async def send(message):
+            received[0] += 1
+            if received[0] >= expected[0]:
+                everyone.set()
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        sessions = [
+            asyncio.ensure_future(websocket_session([f'user:bench-{index}', 'event:bench'], receive, send))
+            for index in range(count)
+        ]
+        await asyncio.sleep(0)  # let every session subscribe
+        connect_time = time.perf_counter() - started
+        await asyncio.sleep(idle)
+        per_connection = (tracemalloc.get_traced_memory()[0] - baseline) / count
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        publish('event:bench', {'type': 'tickets', 'event': 'bench', 'available_tickets': 0})
+        await everyone.wait()
+        broadcast_time = time.perf_counter() - started
+
+        received[0], expected[0] = 0, count
+        everyone.clear()
+        started = time.perf_counter()
+        publish_many([f'user:bench-{index}' for index in range(count)], {'type': 'timeline', 'post': 0})
+        await everyone.wait()
+        fan_out_time = time.perf_counter() - started
+
+        leave.set()
+        await asyncio.gather(*sessions)
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(f'{count} idle connections opened in {connect_time * 1000:.0f} ms')
+        self.stdout.write(f'{per_connection / 1024:.1f} KiB per idle connection, {max_rss:.0f} MiB peak RSS')
+        self.stdout.write(f'One broadcast to all: {broadcast_time * 1000:.0f} ms')
+        self.stdout.write(self.style.SUCCESS(f'One message to each client: {fan_out_time * 1000:.0f} ms'))
@@ -0,0 +1,83 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from noctra_app.models import Club, Event, Ticket
+from noctra_app.tickets import SoldOut, purchase_tickets, refresh_available_tickets, set_inventory_shards
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent ticket purchases at a single throwaway Event and check for oversell. '
+        'Writes to the configured database, so point it at a scratch copy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=2000, help='Number of purchase attempts')
+        parser.add_argument('--tickets', type=int, default=500, help='Tickets on sale')
+        parser.add_argument('--quantity', type=int, default=1, help='Tickets per purchase')
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--shards', type=int, default=0, help='Split the inventory across N buckets')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(username=f'bench_{suffix}')
+        club = Club.objects.create(name=f'Bench club {suffix}', main_location='bench', contact_number='0', created_by=user)
+        event = Event.objects.create(
+            club=club, name=f'Bench night {suffix}', date=timezone.now() + timedelta(days=1),
+            ticket_price=10, total_tickets=options['tickets'], available_tickets=options['tickets'],
+        )
+        if options['shards']:
+            event = set_inventory_shards(event, options['shards'])
+
+        def buy(_):
+            try:
+                purchase_tickets(user, event, options['quantity'])
+                return 'sold'
+            except SoldOut:
+                return 'sold_out'
+            except OperationalError:
+                # SQLite gives up with "database is locked" once its busy timeout runs out
+                return 'error'
+            finally:
+                # One connection per purchase, like a request with CONN_MAX_AGE=0
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(buy, range(options['buyers'])))
+        elapsed = time.perf_counter() - started
+
+        if event.shard_count:
+            refresh_available_tickets(event)
+        event.refresh_from_db()
+        issued = Ticket.objects.filter(event=event).count()
+        sold = results.count('sold')
+
+        self.stdout.write(
+            f"{options['buyers']} purchases on {options['threads']} threads, {options['shards']} shards, in {elapsed:.2f}s "
+            f"({options['buyers'] / elapsed:.0f} purchases/s)\n"
+            f"sold={sold} sold_out={results.count('sold_out')} errors={results.count('error')}\n"
+            f"tickets issued={issued} available={event.available_tickets} total={event.total_tickets}"
+        )
+
+        consistent = (
+            issued == sold * options['quantity']
+            and issued + event.available_tickets == event.total_tickets
+            and issued <= event.total_tickets
+        )
+
+        if not options['keep']:
+            club.delete()
+            user.delete()
+
+        if not consistent:
+            raise CommandError('Inventory mismatch: tickets were oversold or lost')
+        self.stdout.write(self.style.SUCCESS('No oversell'))
@@ -0,0 +1,39 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from noctra_app.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the "people you may know" and club recommendations of every user from follows, '
+        'co-attendance (tickets and reservations) and shared hashtags. Meant to run nightly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Worker processes scoring shards')
+        parser.add_argument('--shard-size', type=int, default=500, help='Users per shard')
+        parser.add_argument('--limit', type=int, default=20, help='Recommendations kept per user and kind')
+        parser.add_argument(
+            '--max-tag-users', type=int, default=1000,
+            help='Hashtags used by more people than this are too generic to count as an affinity',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        done = 0
+
+        def progress(shard_size, written):
+            nonlocal done
+            done += shard_size
+            self.stdout.write(f'{done} users scored, {written} recommendations written')
+
+        profiles, written = build_recommendations(
+            processes=options['processes'], shard_size=options['shard_size'], limit=options['limit'],
+            max_tag_users=options['max_tag_users'], progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{written} recommendations for {profiles} users in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from noctra_app.models import Comment, Like, Post, live_count
+
+
+class Command(BaseCommand):
+    help = 'Recompute the like, comment and repost counters on Post from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        counts = {
+            'like_count': live_count(Like, 'post'),
+            'comment_count': live_count(Comment, 'post'),
+            'repost_count': live_count(Post, 'original_post'),
+        }
+
+        checked = fixed = 0
+        last_id = 0
+        while True:
+            ids = list(Post.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            checked += len(ids)
+
+            # Only rewrite the posts that drifted; the UPDATE recounts in SQL so concurrent writes are not lost
+            drifted = list(
+                Post.objects.filter(pk__in=ids)
+                .annotate(**{f'live_{field}': expression for field, expression in counts.items()})
+                .exclude(**{field: F(f'live_{field}') for field in counts})
+                .values_list('pk', flat=True)
+            )
+            if drifted:
+                fixed += Post.objects.filter(pk__in=drifted).update(**counts)
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} posts, fixed counters on {fixed}'))
@@ -2,7 +2,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from django.core.files.storage import FileSystemStorage
+from .storage import content_store
 from django.conf import settings
 import os
 import uuid
@@ -25,22 +25,15 @@ class MediaStorageAPI(APIView):
             if file_category not in ['profile_pictures', 'cover_pictures', 'posts', 'stories', 'audios', 'documents', 'profile_videos']:
                 return Response({'error': 'Invalid file category'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Dynamically create the directory path based on the file type and category
-            media_dir = os.path.join(self.media_base_path, file_type, file_category)
-
-            # Ensure the directory exists
-            os.makedirs(media_dir, exist_ok=True)
-
             # Generate a unique filename (to avoid name conflicts)
             file_extension = os.path.splitext(file.name)[1]  # Extract file extension (e.g., '.jpg')
             unique_filename = f"{uuid.uuid4().hex}{file_extension}"  # Unique file name
 
-            # Save the file
-            fs = FileSystemStorage(location=media_dir)
-            filename = fs.save(unique_filename, file)
+            # Save the file once per distinct content; these blobs are only referenced by URL, so never released
+            filename = content_store.save(unique_filename, file)
             
             # Generate the URL for the uploaded file
-            file_url = os.path.join('/media', file_type, file_category, filename)
+            file_url = content_store.url(filename)
 
             # Return the URL of the uploaded file
             return Response({'file_url': file_url}, status=status.HTTP_200_OK)
@@ -0,0 +1,59 @@
+import os
+
+from django.conf import settings
+
+from .image_derivatives import render_derivatives
+from .models import PostMedia, UserProfile
+from .profile_cache import invalidate_profile
+from .tasks import run_in_process
+from .transcoding import schedule_transcode
+
+
+# Manifests look like {"source": "<file name>", "variants": [{"width": 320, "format": "webp", "name": "..."}]}
+
+def _render(name, then, *then_args):
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    if not os.path.isfile(path):
+        return
+    args = (path, settings.IMAGE_DERIVATIVE_WIDTHS, settings.IMAGE_DERIVATIVE_FORMATS, settings.IMAGE_DERIVATIVE_QUALITY)
+    run_in_process(render_derivatives, args, then, *then_args, name)
+
+
+def _manifest(name, variants):
+    folder = os.path.dirname(name)
+    return {
+        'source': name,
+        'variants': [
+            {'width': variant['width'], 'format': variant['format'], 'name': os.path.join(folder, variant['file'])}
+            for variant in variants
+        ],
+    }
+
+
+def process_post_media(media):
+    # Entry point for every new PostMedia, whichever path uploaded it
+    if media.file_type == 'image':
+        _render(media.file.name, _save_post_media_manifest, media.pk)
+    elif media.file_type == 'video':
+        schedule_transcode(media)
+
+
+def _save_post_media_manifest(media_id, name, variants):
+    # Matching on the file name skips stale results if the file was swapped in the meantime
+    PostMedia.objects.filter(pk=media_id, file=name).update(derivatives=_manifest(name, variants))
+
+
+def process_profile_images(profile):
+    for field in ('profile_pic', 'cover_pic'):
+        name = getattr(profile, field).name
+        default = profile._meta.get_field(field).default
+        # The shipped default pictures are skipped, only real uploads get variants
+        if name and name != default and getattr(profile, f'{field}_derivatives').get('source') != name:
+            _render(name, _save_profile_manifest, profile.pk, profile.user_id, field)
+
+
+def _save_profile_manifest(profile_id, user_id, field, name, variants):
+    UserProfile.objects.filter(pk=profile_id, **{field: name}).update(
+        **{f'{field}_derivatives': _manifest(name, variants)}
+    )
+    invalidate_profile(profile_id, user_id)
@@ -0,0 +1,122 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+# Content-addressed blobs (plus their _w<width>, _poster and _hls/ derivatives) never change content,
+# so browsers and CDNs may keep them forever
+IMMUTABLE_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:(?:_w\d+|_poster)?\.\w+|_hls/.+)$')
+# Files still being written: chunked uploads in progress and blobs being hashed
+PRIVATE_PREFIXES = ('uploads/partial/', 'blobs/staging/')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+# HLS output, .ts would otherwise be guessed as a Qt translation file
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) for a single byte range, None to serve the whole file
+    (no header, multiple ranges or syntax we ignore), or False when it cannot be satisfied.
+    """
+    match = RANGE_HEADER.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N is the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as media_file:
+        media_file.seek(start)
+        while length > 0:
+            data = media_file.read(min(BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve_media(request, path):
+    """
+    Serves MEDIA_ROOT with ETag/304, single HTTP ranges (206) and long-lived caching for immutable names.
+    With MEDIA_OFFLOAD set, the bytes are left to the front server through X-Accel-Redirect or X-Sendfile.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        # Normalized, so "uploads//partial/" or "a/../uploads/partial/" cannot slip past the prefixes
+        path = os.path.relpath(full_path, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+        if path.startswith(PRIVATE_PREFIXES):
+            raise Http404("Media file not found")
+        stats = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("Media file not found")
+    if not stat.S_ISREG(stats.st_mode):
+        raise Http404("Media file not found")
+
+    size = stats.st_size
+    etag = f'"{stats.st_mtime_ns:x}-{size:x}"'
+    content_type, encoding = mimetypes.guess_type(full_path)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stats.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': (
+            'public, max-age=31536000, immutable' if IMMUTABLE_NAME.search(path) else 'public, no-cache'
+        ),
+    }
+
+    if etag in request.headers.get('If-None-Match', ''):
+        return HttpResponseNotModified(headers=headers)
+
+    offload = settings.MEDIA_OFFLOAD
+    if offload:
+        # The front server handles ranges, conditional requests and sendfile itself
+        response = HttpResponse(content_type=content_type or 'application/octet-stream', headers=headers)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+        else:
+            response['X-Sendfile'] = full_path
+        return response
+
+    byte_range = None
+    if request.headers.get('If-Range', etag) == etag:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    if byte_range is False:
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+
+    if byte_range is None:
+        # Whole file: FileResponse lets the WSGI server use wsgi.file_wrapper (sendfile) when it has one
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(full_path, start, end - start + 1),
+            status=206,
+            content_type=content_type or 'application/octet-stream',
+            headers={**headers, 'Content-Range': f'bytes {start}-{end}/{size}', 'Content-Length': str(end - start + 1)},
+        )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0004_alter_mention_post'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='notification',
+            old_name='recipient',
+            new_name='user',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='notification_type',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='post',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='sender',
+        ),
+        migrations.AlterField(
+            model_name='mention',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_mention', to='noctra_app.post'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='message',
+            field=models.TextField(),
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='noctra_app.feed')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='noctra_app.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['feed', '-created_at', '-post'], name='timeline_feed_keyset_idx')],
+                'unique_together': {('feed', 'post')},
+            },
+        ),
+    ]
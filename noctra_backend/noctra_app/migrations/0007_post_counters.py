@@ -0,0 +1,47 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('noctra_app', 'Post')
+    Like = apps.get_model('noctra_app', 'Like')
+    Comment = apps.get_model('noctra_app', 'Comment')
+
+    def live_count(model, field):
+        rows = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('pk'))
+        return Coalesce(Subquery(rows.values('total')), 0)
+
+    Post.objects.update(
+        like_count=live_count(Like, 'post'),
+        comment_count=live_count(Comment, 'post'),
+        repost_count=live_count(Post, 'original_post'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='repost_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
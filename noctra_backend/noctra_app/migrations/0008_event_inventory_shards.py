@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0007_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='EventInventoryShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('available', models.PositiveIntegerField()),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_shards', to='noctra_app.event')),
+            ],
+            options={
+                'unique_together': {('event', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0008_event_inventory_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='used_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
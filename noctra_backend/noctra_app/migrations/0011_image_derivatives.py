@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0010_mediaupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postmedia',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='cover_pic_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_pic_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:44
+
+import noctra_app.models
+import noctra_app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0011_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='postmedia',
+            name='file',
+            field=models.FileField(storage=noctra_app.storage.get_content_store, upload_to=noctra_app.models.post_media_upload_path),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='cover_pic',
+            field=models.ImageField(blank=True, default='images/cover_pictures/default_cover.jpg', null=True, storage=noctra_app.storage.get_content_store, upload_to=noctra_app.models.upload_cover_pic),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='profile_pic',
+            field=models.ImageField(blank=True, default='images/profile_pictures/default_profile.jpg', null=True, storage=noctra_app.storage.get_content_store, upload_to=noctra_app.models.upload_profile_pic),
+        ),
+    ]
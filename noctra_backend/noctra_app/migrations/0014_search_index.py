@@ -0,0 +1,90 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+SQLITE_FORWARD = [
+    # External-content FTS5 table: the text stays in noctra_app_searchentry, the triggers keep the index in step
+    """
+    CREATE VIRTUAL TABLE noctra_app_searchentry_fts USING fts5(
+        title, body, content='noctra_app_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER noctra_app_searchentry_ai AFTER INSERT ON noctra_app_searchentry BEGIN
+        INSERT INTO noctra_app_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER noctra_app_searchentry_ad AFTER DELETE ON noctra_app_searchentry BEGIN
+        INSERT INTO noctra_app_searchentry_fts(noctra_app_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER noctra_app_searchentry_au AFTER UPDATE ON noctra_app_searchentry BEGIN
+        INSERT INTO noctra_app_searchentry_fts(noctra_app_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO noctra_app_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS noctra_app_searchentry_au',
+    'DROP TRIGGER IF EXISTS noctra_app_searchentry_ad',
+    'DROP TRIGGER IF EXISTS noctra_app_searchentry_ai',
+    'DROP TABLE IF EXISTS noctra_app_searchentry_fts',
+]
+
+POSTGRESQL_FORWARD = [
+    # The 'simple' configuration: no stemming, captions and venue names mix languages
+    """
+    ALTER TABLE noctra_app_searchentry ADD COLUMN document tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') || setweight(to_tsvector('simple', body), 'B')
+    ) STORED
+    """,
+    'CREATE INDEX noctra_app_searchentry_document_idx ON noctra_app_searchentry USING GIN (document)',
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS noctra_app_searchentry_document_idx',
+    'ALTER TABLE noctra_app_searchentry DROP COLUMN IF EXISTS document',
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+create_fulltext_index = _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD})
+drop_fulltext_index = _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0013_video_transcoding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('club', 'Club'), ('event', 'Event')], max_length=10)),
+                ('object_id', models.CharField(max_length=36)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        # Other backends get no full-text index, search.py falls back to plain lookups there
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
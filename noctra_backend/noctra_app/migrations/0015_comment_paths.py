@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    # Level by level from the roots, every parent has its path before its replies are visited
+    Comment = apps.get_model('noctra_app', 'Comment')
+    level = {pk: ('', post_id) for pk, post_id in Comment.objects.filter(parent__isnull=True).values_list('pk', 'post_id')}
+    depth = 0
+    while level:
+        updates = []
+        for pk, (parent_path, post_id) in level.items():
+            segment = str(pk).zfill(10)
+            updates.append(Comment(pk=pk, post_id=post_id, depth=depth,
+                                   path=f'{parent_path}/{segment}' if parent_path else segment))
+        Comment.objects.bulk_update(updates, ['path', 'depth', 'post_id'], batch_size=500)
+        paths = {comment.pk: (comment.path, comment.post_id) for comment in updates}
+        parent_ids = list(paths)
+        level = {}
+        for start in range(0, len(parent_ids), 500):
+            replies = Comment.objects.filter(parent_id__in=parent_ids[start:start + 500]).values_list('pk', 'parent_id')
+            level.update((pk, paths[parent_id]) for pk, parent_id in replies)
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0014_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=1024),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:59
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def dedupe_and_count_follows(apps, schema_editor):
+    Follow = apps.get_model('noctra_app', 'Follow')
+    UserProfile = apps.get_model('noctra_app', 'UserProfile')
+    ClubProfile = apps.get_model('noctra_app', 'ClubProfile')
+
+    # Rows the new check constraint would reject: no target at all, or both (keep the user edge)
+    Follow.objects.filter(following_user__isnull=True, following_club__isnull=True).delete()
+    Follow.objects.filter(following_user__isnull=False, following_club__isnull=False).update(following_club=None)
+
+    # Keep the oldest row of every duplicated edge
+    for target in ('following_user', 'following_club'):
+        duplicates = (
+            Follow.objects.filter(**{f'{target}__isnull': False}).values('follower', target)
+            .annotate(rows=Count('id'), keep=Min('id')).filter(rows__gt=1)
+        )
+        for edge in duplicates:
+            Follow.objects.filter(follower=edge['follower'], **{target: edge[target]}).exclude(id=edge['keep']).delete()
+
+    def live_count(field):
+        rows = Follow.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('pk'))
+        return Coalesce(Subquery(rows.values('total')), 0)
+
+    UserProfile.objects.update(followers_count=live_count('following_user'), following_count=live_count('follower'))
+    ClubProfile.objects.update(followers_count=live_count('following_club'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0015_comment_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clubprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following_user', '-created_at', '-id'], name='follow_user_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following_club', '-created_at', '-id'], name='follow_club_keyset_idx'),
+        ),
+        migrations.RunPython(dedupe_and_count_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('following_club__isnull', True), ('following_user__isnull', False)), models.Q(('following_club__isnull', False), ('following_user__isnull', True)), _connector='OR'), name='follow_single_target'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(condition=models.Q(('following_user__isnull', False)), fields=('follower', 'following_user'), name='unique_user_follow'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(condition=models.Q(('following_club__isnull', False)), fields=('follower', 'following_club'), name='unique_club_follow'),
+        ),
+    ]
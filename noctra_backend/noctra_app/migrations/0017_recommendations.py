@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0016_follow_graph'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'User'), ('club', 'Club')], max_length=10)),
+                ('score', models.FloatField()),
+                ('reasons', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='noctra_app.userprofile')),
+                ('target_club', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='noctra_app.clubprofile')),
+                ('target_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='noctra_app.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', 'kind', '-score'], name='recommendation_profile_idx')],
+            },
+        ),
+    ]
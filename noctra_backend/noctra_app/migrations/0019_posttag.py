@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noctra_app', '0018_notification_pipeline'),
+    ]
+
+    operations = [
+        # Post.tags keeps its table, the through model only takes it over in the migration state
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PostTag',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='noctra_app.post')),
+                        ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='noctra_app.tag')),
+                    ],
+                    options={
+                        'db_table': 'noctra_app_post_tags',
+                        'unique_together': {('post', 'tag')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='tags',
+                    field=models.ManyToManyField(blank=True, related_name='posts', through='noctra_app.PostTag', to='noctra_app.tag'),
+                ),
+            ],
+        ),
+        # Links that exist already are treated as explicit, editing a caption never drops them
+        migrations.AddField(
+            model_name='posttag',
+            name='from_caption',
+            field=models.BooleanField(default=False),
+        ),
+    ]
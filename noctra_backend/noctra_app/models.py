@@ -1,8 +1,12 @@
 from datetime import date
 import uuid
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .storage import get_content_store
 import os
 
 
@@ -15,6 +19,49 @@ def upload_cover_pic(instance, filename):
     return f'images/cover_pictures/{instance.user.username}/{uuid.uuid4().hex}.{filename.split(".")[-1]}'
 
 
+class MediaBlob(models.Model):
+    # One stored file in the content-addressed media store, shared by every upload with the same bytes
+    digest = models.CharField(max_length=64, primary_key=True)  # sha256 hex
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def acquire(cls, digest, name, size):
+        # Call inside a transaction: the row stays locked until the caller has the file in place
+        if cls.objects.select_for_update().filter(pk=digest).exists():
+            cls.objects.filter(pk=digest).update(ref_count=models.F('ref_count') + 1)
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(digest=digest, name=name, size=size, ref_count=1)
+        except IntegrityError:
+            # Someone stored the same bytes at the same moment
+            cls.objects.select_for_update().filter(pk=digest).exists()
+            cls.objects.filter(pk=digest).update(ref_count=models.F('ref_count') + 1)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class CounterFieldsMixin:
+    """
+    For models with denormalized counters that are only ever changed with F() updates:
+    a plain save() of an existing row writes every field except COUNTER_FIELDS, so a
+    possibly stale instance never writes old counts back.
+    """
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
 class Feed(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -24,7 +71,7 @@ class Feed(models.Model):
         return f"{self.user.username}'s Feed"
 
 
-class UserProfile(models.Model):
+class UserProfile(CounterFieldsMixin, models.Model):
     ROLE_CHOICES = [
         ('customer', 'Customer'),
         ('club_admin', 'Club Admin'),
@@ -34,11 +81,11 @@ class UserProfile(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     profile_pic = models.ImageField(
-        upload_to=upload_profile_pic, null=True, blank=True,
+        upload_to=upload_profile_pic, storage=get_content_store, null=True, blank=True,
         default='images/profile_pictures/default_profile.jpg'
     )
     cover_pic = models.ImageField(
-        upload_to=upload_cover_pic, null=True, blank=True,
+        upload_to=upload_cover_pic, storage=get_content_store, null=True, blank=True,
         default='images/cover_pictures/default_cover.jpg'
     )
     playlist = models.URLField(max_length=500, null=True, blank=True)
@@ -49,9 +96,19 @@ class UserProfile(models.Model):
     anonymous = models.BooleanField(default=False)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
     feed = models.OneToOneField(Feed, on_delete=models.CASCADE, null=True, blank=True)
+    # Manifests of the resized variants of each picture, see media_pipeline.py
+    profile_pic_derivatives = models.JSONField(default=dict, blank=True)
+    cover_pic_derivatives = models.JSONField(default=dict, blank=True)
+    # Denormalized Follow counters, see follow_graph.py
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Denormalized unread Notification count, see notifications.py
+    unread_notifications = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    COUNTER_FIELDS = ('followers_count', 'following_count', 'unread_notifications')
+
     @property
     def age(self):
         if self.date_of_birth:
@@ -104,16 +161,19 @@ class ClubAdmin(models.Model):
         return f"{self.user.username}"
 
 
-class ClubProfile(models.Model):
+class ClubProfile(CounterFieldsMixin, models.Model):
     club = models.OneToOneField(Club, on_delete=models.CASCADE, related_name='profile')
     profile_pic = models.URLField(null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     address = models.CharField(max_length=255, null=True, blank=True)
     feed = models.OneToOneField(Feed, on_delete=models.CASCADE, null=True, blank=True)
     managed_by = models.ManyToManyField(ClubAdmin, related_name='managed_clubs')
+    followers_count = models.PositiveIntegerField(default=0)  # see follow_graph.py
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    COUNTER_FIELDS = ('followers_count',)
+
     def __str__(self):
         return self.club.name
 
@@ -126,6 +186,8 @@ class Event(models.Model):
     ticket_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_tickets = models.PositiveIntegerField()
     available_tickets = models.PositiveIntegerField()
+    # 0 keeps the single available_tickets counter, N > 0 splits it across N EventInventoryShard rows
+    shard_count = models.PositiveSmallIntegerField(default=0)
     created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='created_events')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -139,6 +201,19 @@ class Event(models.Model):
         return self.name
 
 
+class EventInventoryShard(models.Model):
+    # One bucket of a sharded event's inventory; buyers spread their decrements across buckets
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='inventory_shards')
+    index = models.PositiveSmallIntegerField()
+    available = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ("event", "index")
+
+    def __str__(self):
+        return f"{self.event.name} shard {self.index} ({self.available} left)"
+
+
 class Ticket(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tickets')
@@ -148,6 +223,7 @@ class Ticket(models.Model):
     purchased_at = models.DateTimeField(auto_now_add=True)
     price_paid = models.DecimalField(max_digits=10, decimal_places=2)
     valid_until = models.DateTimeField()
+    used_at = models.DateTimeField(null=True, blank=True)  # set when the ticket is scanned at the door
 
     def __str__(self):
         return f"Ticket {self.id} ({self.event.name if self.event else 'No event'})"
@@ -184,15 +260,41 @@ def post_media_upload_path(instance, filename):
     return os.path.join(base, filename)
 
 
-class Post(models.Model):
+def live_count(model, field):
+    # Correlated COUNT(*) of the model rows whose `field` points at the outer row
+    rows = model.objects.filter(**{field: models.OuterRef('pk')}).order_by().values(field).annotate(total=models.Count('pk'))
+    return Coalesce(models.Subquery(rows.values('total')), 0)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_serializer(self):
+        # Loads everything PostSerializer, __str__ and mentioned_usernames touch in a fixed number of queries
+        return self.select_related('owner').prefetch_related('tags', 'media', 'mentions')
+
+
+class Post(CounterFieldsMixin, models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
     caption = models.TextField(blank=False, null=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_public = models.BooleanField(default=True)
-    tags = models.ManyToManyField("Tag", related_name='posts', blank=True)
+    tags = models.ManyToManyField("Tag", related_name='posts', blank=True, through="PostTag")
     mentions = models.ManyToManyField(User, related_name="mentioned_posts", blank=True)
     original_post = models.ForeignKey("self", null=True, blank=True, on_delete=models.SET_NULL, related_name="reposts")
+    # Denormalized counters, only ever changed with F() updates (see signals.py)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    repost_count = models.PositiveIntegerField(default=0)
+
+    objects = PostQuerySet.as_manager()
+
+    COUNTER_FIELDS = ('like_count', 'comment_count', 'repost_count')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-id'], name='post_owner_keyset_idx'),
+            models.Index(fields=['-created_at', '-id'], name='post_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"{self.owner.username} - {self.caption} - {self.created_at.strftime('%Y-%m-%d')}"
@@ -201,10 +303,38 @@ class Post(models.Model):
         return [user.username for user in self.mentions.all()]
 
 
+class TimelineEntry(models.Model):
+    # One row per (follower feed, post), written when a post is fanned out
+    feed = models.ForeignKey(Feed, on_delete=models.CASCADE, related_name='entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()  # copy of post.created_at, used as the keyset
+
+    class Meta:
+        unique_together = ("feed", "post")
+        indexes = [
+            models.Index(fields=['feed', '-created_at', '-post'], name='timeline_feed_keyset_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in Feed {self.feed_id}"
+
+
 class PostMedia(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='media')
-    file = models.FileField(upload_to=post_media_upload_path)
+    file = models.FileField(upload_to=post_media_upload_path, storage=get_content_store)
     file_type = models.CharField(max_length=10)  # image, video, audio, etc.
+    derivatives = models.JSONField(default=dict, blank=True)  # resized/re-encoded variants, see media_pipeline.py
+
+    # Videos only, filled in by the transcode queue (transcoding.py)
+    TRANSCODE_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    transcode_status = models.CharField(max_length=10, choices=TRANSCODE_STATUS_CHOICES, blank=True)
+    hls_manifest = models.CharField(max_length=255, blank=True)  # storage name of master.m3u8
+    poster = models.CharField(max_length=255, blank=True)
 
     def save(self, *args, **kwargs):
         # Automatically determine media type (optional, bonus)
@@ -222,6 +352,35 @@ class PostMedia(models.Model):
     def __str__(self):
         return f"Media for Post {self.post.id}"
     
+class MediaUpload(models.Model):
+    # A resumable chunked upload that becomes a PostMedia once finalized and processed
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='media_uploads')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    media = models.OneToOneField(PostMedia, null=True, blank=True, on_delete=models.SET_NULL, related_name='upload')
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def partial_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial', f'{self.id.hex}.part')
+
+    def __str__(self):
+        return f"Upload {self.filename} ({self.received_size}/{self.total_size})"
+
+
 class Mention(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='post_mention')
     mentioned_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mentioned_in_posts')
@@ -244,12 +403,56 @@ class Tag(models.Model):
         super().save(*args, **kwargs)
 
 
+class PostTag(models.Model):
+    # Post.tags link, from_caption marks the ones a #hashtag added so editing the caption only removes those
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    from_caption = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'noctra_app_post_tags'  # the table of the former auto-created through model
+        unique_together = [('post', 'tag')]
+
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     parent = models.ForeignKey("self", null=True, blank=True, on_delete=models.CASCADE, related_name="replies")
+    # Materialized path: the zero-padded ids from the root down to this comment, "0000000012/0000000015".
+    # Sorting a post's comments on it yields whole threads in order, see comment_tree.py
+    path = models.CharField(max_length=1024, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    PATH_SEGMENT = 10
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='comment_post_keyset_idx'),
+            models.Index(fields=['-created_at', '-id'], name='comment_keyset_idx'),
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ]
+
+    @classmethod
+    def path_segment(cls, pk):
+        return str(pk).zfill(cls.PATH_SEGMENT)
+
+    def save(self, *args, **kwargs):
+        creating = self._state.adding
+        parent_path = ''
+        if creating and self.parent_id:
+            # Replies always live on their parent's post
+            parent_path, self.depth, self.post_id = Comment.objects.filter(pk=self.parent_id).values_list(
+                'path', 'depth', 'post_id'
+            ).get()
+            self.depth += 1
+        super().save(*args, **kwargs)
+        if creating:
+            # The id only exists after the insert, so the path is written right after it
+            segment = self.path_segment(self.pk)
+            self.path = f'{parent_path}/{segment}' if parent_path else segment
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
 
     def __str__(self):
         return f"{self.author.username} comment on Post {self.post.id}"
@@ -262,6 +465,10 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ("post", "user")
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='like_post_keyset_idx'),
+            models.Index(fields=['-created_at', '-id'], name='like_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} liked Post {self.post.id}"
@@ -278,10 +485,29 @@ class SavedPost(models.Model):
 
 
 class Notification(models.Model):
+    KIND_CHOICES = [
+        ('like', 'Like'),
+        ('comment', 'Comment'),
+        ('reply', 'Reply'),
+        ('follow', 'Follow'),
+        ('mention', 'Mention'),
+        ('reservation', 'Reservation'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(default=timezone.now)
+    # Unread notifications with the same kind and target ("post:12") are merged into one row
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, blank=True)
+    target = models.CharField(max_length=64, blank=True)
+    actors = models.JSONField(default=list, blank=True)  # most recent actor user ids first
+    actor_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-timestamp'], name='notification_user_unread_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user.username}"
@@ -293,6 +519,31 @@ class Follow(models.Model):
     following_club = models.ForeignKey(ClubProfile, null=True, blank=True, on_delete=models.CASCADE, related_name='club_followers')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Exactly one target, followed at most once
+            models.CheckConstraint(
+                check=models.Q(following_user__isnull=False, following_club__isnull=True)
+                | models.Q(following_user__isnull=True, following_club__isnull=False),
+                name='follow_single_target',
+            ),
+            models.UniqueConstraint(
+                fields=['follower', 'following_user'], condition=models.Q(following_user__isnull=False),
+                name='unique_user_follow',
+            ),
+            models.UniqueConstraint(
+                fields=['follower', 'following_club'], condition=models.Q(following_club__isnull=False),
+                name='unique_club_follow',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['follower', '-created_at', '-id'], name='follow_follower_keyset_idx'),
+            models.Index(fields=['-created_at', '-id'], name='follow_keyset_idx'),
+            # Follower lists, newest first
+            models.Index(fields=['following_user', '-created_at', '-id'], name='follow_user_keyset_idx'),
+            models.Index(fields=['following_club', '-created_at', '-id'], name='follow_club_keyset_idx'),
+        ]
+
     def __str__(self):
         return f"{self.follower} follows {self.following_user or self.following_club}"
 
@@ -317,3 +568,52 @@ class Reservation(models.Model):
 
     def __str__(self):
         return f"{self.user.username} reservation for {self.event.name}"
+
+
+class SearchEntry(models.Model):
+    """
+    One searchable document per post, club or event, kept in sync by signals (see search.py).
+    The full-text index over title/body lives next to this table: an FTS5 table on SQLite,
+    a tsvector column with a GIN index on Postgres.
+    """
+    KIND_CHOICES = [
+        ('post', 'Post'),
+        ('club', 'Club'),
+        ('event', 'Event'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=36)  # Post ids are integers, Club and Event ids are UUIDs
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class Recommendation(models.Model):
+    # Precomputed "people you may know" and club suggestions, rebuilt by the build_recommendations command
+    KIND_CHOICES = [
+        ('user', 'User'),
+        ('club', 'Club'),
+    ]
+
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='recommendations')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    target_user = models.ForeignKey(UserProfile, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    target_club = models.ForeignKey(ClubProfile, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    reasons = models.JSONField(default=dict, blank=True)  # e.g. {"mutual": 3, "events": 1}
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['profile', 'kind', '-score'], name='recommendation_profile_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.target_user_id or self.target_club_id} for {self.profile_id} ({self.score})"
@@ -0,0 +1,172 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Notification, UserProfile
+from .profile_cache import invalidate_profile
+from .pubsub import publish
+from .serializers import NotificationSerializer
+from .tasks import PeriodicFlusher
+
+VERBS = {
+    'like': 'liked your post',
+    'comment': 'commented on your post',
+    'reply': 'replied to your comment',
+    'follow': 'started following you',
+    'mention': 'mentioned you in a post',
+}
+MAX_ACTORS = 10  # actor ids kept on a merged notification
+
+
+def render_message(kind, actor_name, actor_count):
+    # "ana liked your post", then "12 people liked your post" once more join in
+    if actor_count > 1:
+        return f"{actor_count} people {VERBS[kind]}"
+    return f"{actor_name or 'Someone'} {VERBS[kind]}"
+
+
+class NotificationBuffer:
+    """
+    Collects notification events in memory and writes them in bulk every `interval` seconds.
+    Events for the same (user, kind, target) are merged, in the buffer and with the user's
+    unread row for that target if there is one, so twelve likes become one notification.
+    Each flush also bumps the denormalized UserProfile.unread_notifications counters and
+    pushes the written rows to the users' connected clients, see realtime.py.
+    """
+
+    def __init__(self, interval):
+        self._lock = threading.Lock()
+        self._pending = {}  # (user_id, kind, target) -> {'actors': [user ids, newest first], 'message': str or None}
+        self._flusher = PeriodicFlusher(self.flush, interval, 'notifications')
+
+    def notify(self, user_id, kind, target, actor_id=None, message=None):
+        """
+        Queues a notification for user_id once the current transaction commits, so a rolled back
+        like or comment never notifies anyone. `message` replaces the rendered text (kinds without a verb).
+        """
+        if actor_id is not None and actor_id == user_id:
+            return
+        transaction.on_commit(lambda: self._add(user_id, kind, target, actor_id, message))
+
+    def _add(self, user_id, kind, target, actor_id, message):
+        self._flusher.start()
+        with self._lock:
+            self._merge((user_id, kind, target), [actor_id] if actor_id is not None else [], message)
+
+    def _merge(self, key, actors, message):
+        event = self._pending.setdefault(key, {'actors': [], 'message': None})
+        event['actors'] = actors + [actor for actor in event['actors'] if actor not in actors]
+        event['message'] = message or event['message']
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            self._write(pending)
+        except Exception:
+            # Put the batch back behind anything queued since
+            with self._lock:
+                for key, event in pending.items():
+                    queued = self._pending.setdefault(key, {'actors': [], 'message': None})
+                    queued['actors'] += [actor for actor in event['actors'] if actor not in queued['actors']]
+                    queued['message'] = queued['message'] or event['message']
+            raise
+        return len(pending)
+
+    def _write(self, pending):
+        user_ids = {user_id for user_id, _, _ in pending}
+        actor_ids = {actor for event in pending.values() for actor in event['actors']}
+        # Rows for deleted users would fail the foreign key
+        names = dict(User.objects.filter(pk__in=user_ids | actor_ids).values_list('pk', 'username'))
+
+        with transaction.atomic():
+            # Locked until the merge is written, so a concurrent read-all cannot mark a row read
+            # in between and have new actors land on a notification nobody will see as unread
+            unread = Notification.objects.select_for_update().filter(
+                user_id__in=user_ids, is_read=False,
+                kind__in={kind for _, kind, _ in pending}, target__in={target for _, _, target in pending},
+            )
+            existing = {}
+            for notification in unread.order_by('timestamp'):
+                existing[(notification.user_id, notification.kind, notification.target)] = notification
+
+            now = timezone.now()
+            created, merged = [], []
+            for (user_id, kind, target), event in pending.items():
+                if user_id not in names:
+                    continue
+                actors = [actor for actor in event['actors'] if actor in names]
+                notification = existing.get((user_id, kind, target))
+                if notification is None:
+                    notification = Notification(
+                        user_id=user_id, kind=kind, target=target, actor_count=max(len(actors), 1),
+                    )
+                    created.append(notification)
+                else:
+                    notification.actor_count += len([actor for actor in actors if actor not in notification.actors])
+                    actors += [actor for actor in notification.actors if actor not in actors]
+                    merged.append(notification)
+                notification.actors = actors[:MAX_ACTORS]
+                notification.timestamp = now
+                notification.message = event['message'] or render_message(
+                    kind, names.get(actors[0]) if actors else None, notification.actor_count,
+                )
+
+            new_per_user = {}
+            for notification in created:
+                new_per_user[notification.user_id] = new_per_user.get(notification.user_id, 0) + 1
+
+            Notification.objects.bulk_create(created, batch_size=500)
+            Notification.objects.bulk_update(merged, ['actors', 'actor_count', 'message', 'timestamp'], batch_size=500)
+            if new_per_user:
+                # One UPDATE for every user of the batch
+                increments = Case(
+                    *[When(user_id=user_id, then=Value(count)) for user_id, count in new_per_user.items()],
+                    output_field=IntegerField(),
+                )
+                UserProfile.objects.filter(user_id__in=new_per_user).update(
+                    unread_notifications=F('unread_notifications') + increments
+                )
+        invalidate_unread_counts(new_per_user)
+
+        # Connected clients get the row as the list endpoint would show it
+        for notification in created + merged:
+            publish(f'user:{notification.user_id}', {
+                'type': 'notification', 'notification': NotificationSerializer(notification).data,
+            })
+
+
+def invalidate_unread_counts(user_ids):
+    # The counter is part of the cached /me/ payload, F() updates skip the UserProfile signals
+    for profile_id, user_id in UserProfile.objects.filter(user_id__in=user_ids).values_list('id', 'user_id'):
+        invalidate_profile(profile_id, user_id)
+
+
+def mark_read(user, ids=None):
+    """
+    Marks the user's unread notifications (all of them, or those in `ids`) read with a single
+    UPDATE and takes the same number off the unread counter. Returns how many changed.
+    """
+    rows = Notification.objects.filter(user=user, is_read=False)
+    if ids is not None:
+        rows = rows.filter(pk__in=ids)
+    with transaction.atomic():
+        updated = rows.update(is_read=True)
+        if updated:
+            UserProfile.objects.filter(user=user).update(
+                unread_notifications=Greatest(F('unread_notifications') - updated, 0)
+            )
+    if updated:
+        invalidate_unread_counts([user.pk])
+    return updated
+
+
+notifier = NotificationBuffer(settings.NOTIFICATION_FLUSH_INTERVAL)
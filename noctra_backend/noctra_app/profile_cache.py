@@ -0,0 +1,79 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import UserProfile
+from .serializers import image_srcset
+
+
+# The /me/ shape is keyed by user id, the public shape by profile id (as in the URLs)
+def own_profile_key(user_id):
+    return f'userprofile:me:{user_id}'
+
+
+def public_profile_key(profile_id):
+    return f'userprofile:public:{profile_id}'
+
+
+def public_profile_data(user_profile):
+    return {
+        'username': user_profile.user.username,
+        'profile_pic_url': user_profile.get_profile_pic_url(),
+        'profile_pic_srcset': image_srcset(user_profile.profile_pic_derivatives),
+    }
+
+
+def make_entry(data):
+    body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return {'data': data, 'etag': f'"{hashlib.md5(body.encode()).hexdigest()}"'}
+
+
+def get_or_build(key, build):
+    # Read-through: build() runs the queries only on a miss and returns None when there is no profile
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        if data is None:
+            return None
+        entry = make_entry(data)
+        cache.set(key, entry, settings.PROFILE_CACHE_TIMEOUT)
+    return entry
+
+
+def get_public_profiles(profile_ids):
+    """
+    Public profile shapes for many profiles at once: one get_many against the cache,
+    then a single select_related('user') query for the misses, which are cached for next time.
+    """
+    keys = {public_profile_key(profile_id): profile_id for profile_id in profile_ids}
+    profiles = {keys[key]: entry['data'] for key, entry in cache.get_many(keys).items()}
+
+    missing = [profile_id for profile_id in profile_ids if profile_id not in profiles]
+    if missing:
+        fresh = {}
+        for user_profile in UserProfile.objects.select_related('user').filter(id__in=missing):
+            entry = make_entry(public_profile_data(user_profile))
+            fresh[public_profile_key(user_profile.id)] = entry
+            profiles[user_profile.id] = entry['data']
+        cache.set_many(fresh, settings.PROFILE_CACHE_TIMEOUT)
+    return profiles
+
+
+def cached_response(request, entry):
+    # 304 when the client already holds this version
+    if entry['etag'] in request.headers.get('If-None-Match', ''):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(entry['data'])
+    response['ETag'] = entry['etag']
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def invalidate_profile(profile_id, user_id):
+    cache.delete_many([own_profile_key(user_id), public_profile_key(profile_id)])
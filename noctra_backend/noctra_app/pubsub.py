@@ -0,0 +1,93 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+# Channels: 'user:<user id>' (notifications, timeline entries) and 'event:<event id>' (ticket counts)
+
+
+class Subscription:
+    """
+    One connected client. Messages are queued on the client's event loop; a client that stops
+    reading loses its oldest messages instead of growing the queue without bound.
+    """
+
+    def __init__(self, channels, loop, max_queued):
+        self.channels = channels
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=max_queued)
+
+    def deliver(self, payload):
+        # Called from any thread
+        self._loop.call_soon_threadsafe(self._put, payload)
+
+    def _put(self, payload):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(payload)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class LocalBroker:
+    """
+    In-process pub/sub: messages reach the clients connected to this process only, which is
+    enough for a single ASGI worker. Run several workers behind a broker with the same
+    subscribe/unsubscribe/publish methods (REALTIME_BROKER) so every worker sees every message.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # channel -> subscriptions
+
+    def subscribe(self, channels):
+        # Must be called from the event loop that will read the subscription
+        subscription = Subscription(channels, asyncio.get_running_loop(), settings.REALTIME_MAX_QUEUED)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(payload)
+        return len(subscribers)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.REALTIME_BROKER)()
+        return _broker
+
+
+def publish(channel, message):
+    return publish_many([channel], message)
+
+
+def publish_many(channels, message):
+    # Encoded once, however many channels and clients it goes to
+    payload = json.dumps(message, cls=DjangoJSONEncoder)
+    broker = get_broker()
+    return sum(broker.publish(channel, payload) for channel in channels)
@@ -0,0 +1,137 @@
+import asyncio
+import uuid
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.authtoken.models import Token
+
+from .pubsub import get_broker
+
+# Push channel for connected clients: a WebSocket at /ws/ and the same stream as
+# server-sent events at /api/stream/. Both authenticate with ?token=<auth token> (browsers
+# cannot set headers on either) or an "Authorization: Token <key>" header, and take
+# ?events=<id>,<id> to follow the ticket counts of those events.
+#
+# Every message is a JSON object with a "type": "notification", "timeline", "tickets" or "ping".
+
+PING = '{"type": "ping"}'
+
+
+@sync_to_async
+def authenticate(token_key):
+    token = Token.objects.select_related('user').filter(key=token_key).first() if token_key else None
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def token_from(params, authorization):
+    if authorization.startswith('Token '):
+        return authorization[len('Token '):].strip()
+    return params.get('token', [''])[0]
+
+
+def subscription_channels(user, params):
+    """
+    Channels for a client: its own user channel plus up to REALTIME_MAX_EVENTS events.
+    Raises ValueError on malformed event ids.
+    """
+    raw = params.get('events', [''])[0]
+    event_ids = [str(uuid.UUID(value.strip())) for value in raw.split(',') if value.strip()]
+    if len(event_ids) > settings.REALTIME_MAX_EVENTS:
+        raise ValueError(f"At most {settings.REALTIME_MAX_EVENTS} events per connection")
+    return [f'user:{user.pk}'] + [f'event:{event_id}' for event_id in dict.fromkeys(event_ids)]
+
+
+async def _wait_for_disconnect(receive):
+    # Clients only ever listen, anything they send is ignored
+    while (await receive())['type'] != 'websocket.disconnect':
+        pass
+
+
+async def websocket_session(channels, receive, send):
+    """
+    Forwards the published messages of `channels` to an accepted WebSocket until the client leaves.
+    An idle connection costs one subscription and two parked tasks, and a ping every
+    REALTIME_HEARTBEAT_SECONDS so proxies keep it open and dead peers are noticed.
+    """
+    broker = get_broker()
+    subscription = broker.subscribe(channels)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    message = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait(
+                {message, disconnected}, timeout=settings.REALTIME_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                return
+            if message in done:
+                await send({'type': 'websocket.send', 'text': message.result()})
+                message = asyncio.ensure_future(subscription.get())
+            else:
+                await send({'type': 'websocket.send', 'text': PING})
+    finally:
+        broker.unsubscribe(subscription)
+        message.cancel()
+        disconnected.cancel()
+
+
+async def websocket_application(scope, receive, send):
+    # ASGI entry point for every WebSocket connection, see noctra_backend/asgi.py
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    if scope['path'].rstrip('/') != '/ws':
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+
+    params = parse_qs(scope.get('query_string', b'').decode())
+    headers = dict(scope.get('headers', ()))
+    user = await authenticate(token_from(params, headers.get(b'authorization', b'').decode()))
+    if user is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    try:
+        channels = subscription_channels(user, params)
+    except ValueError:
+        await send({'type': 'websocket.close', 'code': 4400})
+        return
+
+    await send({'type': 'websocket.accept'})
+    await websocket_session(channels, receive, send)
+
+
+async def _event_stream(channels):
+    broker = get_broker()
+    subscription = broker.subscribe(channels)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                payload = await asyncio.wait_for(subscription.get(), settings.REALTIME_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+            else:
+                yield f'data: {payload}\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def event_stream(request):
+    # Server-sent events for clients that cannot open a WebSocket. Needs an ASGI server.
+    params = {key: request.GET.getlist(key) for key in request.GET}
+    user = await authenticate(token_from(params, request.headers.get('Authorization', '')))
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+    try:
+        channels = subscription_channels(user, params)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    response = StreamingHttpResponse(_event_stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx would otherwise hold the events back
+    return response
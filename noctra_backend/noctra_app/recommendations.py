@@ -0,0 +1,134 @@
+import multiprocessing
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+
+from .models import ClubProfile, Follow, Recommendation, Reservation, Ticket, UserProfile
+from .recommendation_scoring import init_worker, score_shard
+
+
+def load_graph(max_tag_users):
+    """
+    Reads every signal once into sparse adjacency maps keyed by UserProfile id:
+    follows (people), club_follows and attended_clubs (ClubProfile ids), events and tags.
+    """
+    profile_of_user = dict(UserProfile.objects.values_list('user_id', 'id'))
+    club_profile_of_club = dict(ClubProfile.objects.values_list('club_id', 'id'))
+
+    follows = defaultdict(set)
+    club_follows = defaultdict(set)
+    for follower, user, club in Follow.objects.values_list('follower_id', 'following_user_id', 'following_club_id').iterator():
+        if user:
+            follows[follower].add(user)
+        else:
+            club_follows[follower].add(club)
+
+    # Tickets and non-rejected reservations both count as going to the event
+    events = defaultdict(set)
+    attended_clubs = defaultdict(set)
+    attendance = (
+        list(Ticket.objects.filter(event__isnull=False).values_list('user_id', 'event_id', 'club_id').iterator())
+        + list(Reservation.objects.exclude(status='rejected').values_list('user_id', 'event_id', 'club_id').iterator())
+    )
+    for user_id, event_id, club_id in attendance:
+        profile_id = profile_of_user.get(user_id)
+        if profile_id is None:
+            continue
+        events[profile_id].add(event_id)
+        if club_id in club_profile_of_club:
+            attended_clubs[profile_id].add(club_profile_of_club[club_id])
+
+    tags = defaultdict(set)
+    tag_uses = UserProfile.objects.filter(user__posts__is_public=True, user__posts__tags__isnull=False).values_list(
+        'id', 'user__posts__tags'
+    ).distinct()
+    for profile_id, tag_id in tag_uses.iterator():
+        tags[profile_id].add(tag_id)
+
+    return {
+        'profile_ids': sorted(profile_of_user.values()),
+        'follows': dict(follows),
+        'club_follows': dict(club_follows),
+        'events': dict(events),
+        'attended_clubs': dict(attended_clubs),
+        'tags': dict(tags),
+        'max_tag_users': max_tag_users,
+    }
+
+
+def _write_shard(profile_ids, rows):
+    # Targets deleted while the job ran would fail the foreign keys
+    live_users = set(UserProfile.objects.filter(
+        pk__in={target for _, kind, target, _, _ in rows if kind == 'user'}
+    ).values_list('pk', flat=True))
+    live_clubs = set(ClubProfile.objects.filter(
+        pk__in={target for _, kind, target, _, _ in rows if kind == 'club'}
+    ).values_list('pk', flat=True))
+
+    recommendations = [
+        Recommendation(
+            profile_id=profile_id, kind=kind, score=score, reasons=reasons,
+            target_user_id=target if kind == 'user' else None, target_club_id=target if kind == 'club' else None,
+        )
+        for profile_id, kind, target, score, reasons in rows
+        if target in (live_users if kind == 'user' else live_clubs)
+    ]
+    with transaction.atomic():
+        Recommendation.objects.filter(profile_id__in=profile_ids).delete()
+        Recommendation.objects.bulk_create(recommendations, batch_size=1000)
+    return len(recommendations)
+
+
+def build_recommendations(processes=1, shard_size=500, limit=20, max_tag_users=1000, progress=None):
+    """
+    Scores every profile and replaces its stored recommendations, shard by shard.
+    The graph is loaded once here, scored in `processes` spawned workers, and the results
+    are written back from this process. Returns (profiles, rows written).
+    """
+    graph = load_graph(max_tag_users)
+    profile_ids = graph['profile_ids']
+    shards = [profile_ids[start:start + shard_size] for start in range(0, len(profile_ids), shard_size)]
+    score = partial(score_shard, limit=limit)
+
+    if processes > 1:
+        # spawn, not fork: the parent holds open database connections
+        pool = multiprocessing.get_context('spawn').Pool(processes, initializer=init_worker, initargs=(graph,))
+        scored = pool.imap(score, shards)
+    else:
+        pool = None
+        init_worker(graph)
+        scored = map(score, shards)
+
+    written = 0
+    try:
+        for shard, rows in zip(shards, scored):
+            written += _write_shard(shard, rows)
+            if progress:
+                progress(len(shard), written)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return len(profile_ids), written
+
+
+def stored_recommendations(profile, kind, limit):
+    # Served straight from the table, minus anything followed since the last build
+    rows = Recommendation.objects.filter(profile=profile, kind=kind).order_by('-score')
+    followed = Follow.objects.filter(follower=profile)
+    if kind == 'user':
+        rows = rows.exclude(target_user__in=followed.filter(following_user__isnull=False).values('following_user'))
+        rows = rows.select_related('target_user__user')
+    else:
+        rows = rows.exclude(target_club__in=followed.filter(following_club__isnull=False).values('following_club'))
+        rows = rows.select_related('target_club__club')
+
+    results = []
+    for row in rows[:limit]:
+        if kind == 'user':
+            target_id, name = row.target_user_id, row.target_user.user.username
+        else:
+            target_id, name = row.target_club_id, row.target_club.club.name
+        results.append({'type': kind, 'id': target_id, 'name': name, 'score': row.score, 'reasons': row.reasons})
+    return results
@@ -0,0 +1,145 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Club, ClubProfile, Event, Post, SearchEntry
+
+FTS_TABLE = 'noctra_app_searchentry_fts'
+SEARCH_TOKEN = re.compile(r'\w+')
+MAX_QUERY_TOKENS = 8
+SNIPPET_WORDS = 12
+
+
+# Documents
+
+def post_document(post):
+    # Only public posts are searchable
+    if not post.is_public:
+        return None
+    return '', post.caption
+
+
+def club_document(club):
+    try:
+        profile = club.profile
+    except ClubProfile.DoesNotExist:
+        profile = None
+    parts = [club.main_location, club.description]
+    if profile is not None:
+        parts += [profile.address, profile.description]
+    return club.name, '\n'.join(part for part in parts if part)
+
+
+def event_document(event):
+    return event.name, event.club.name
+
+
+DOCUMENT_BUILDERS = {'post': post_document, 'club': club_document, 'event': event_document}
+
+
+def index_object(kind, obj):
+    document = DOCUMENT_BUILDERS[kind](obj)
+    if document is None:
+        remove_object(kind, obj.pk)
+        return
+    title, body = document
+    SearchEntry.objects.update_or_create(kind=kind, object_id=str(obj.pk), defaults={'title': title, 'body': body})
+
+
+def remove_object(kind, object_id):
+    SearchEntry.objects.filter(kind=kind, object_id=str(object_id)).delete()
+
+
+def rebuild_index(batch_size=1000):
+    # Drops every entry and indexes the whole database again, see the rebuild_search_index command
+    SearchEntry.objects.all().delete()
+    sources = (
+        ('post', Post.objects.filter(is_public=True).only('id', 'caption', 'is_public')),
+        ('club', Club.objects.select_related('profile')),
+        ('event', Event.objects.select_related('club')),
+    )
+    total = 0
+    for kind, queryset in sources:
+        batch = []
+        for obj in queryset.iterator(chunk_size=batch_size):
+            title, body = DOCUMENT_BUILDERS[kind](obj)
+            batch.append(SearchEntry(kind=kind, object_id=str(obj.pk), title=title, body=body))
+            if len(batch) >= batch_size:
+                total += len(SearchEntry.objects.bulk_create(batch))
+                batch = []
+        total += len(SearchEntry.objects.bulk_create(batch))
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+# Queries
+
+def query_tokens(text):
+    return [token.lower() for token in SEARCH_TOKEN.findall(text or '')][:MAX_QUERY_TOKENS]
+
+
+def search(text, kinds=None, limit=20, offset=0):
+    """
+    Ranked full-text search. Every word must match, the last one as a prefix so results
+    show up while the user is still typing. Returns dicts with type, id, title and snippet.
+    """
+    tokens = query_tokens(text)
+    if not tokens:
+        return []
+    kinds = list(kinds or DOCUMENT_BUILDERS)
+
+    if connection.vendor == 'sqlite':
+        rows = _search_sqlite(tokens, kinds, limit, offset)
+    elif connection.vendor == 'postgresql':
+        rows = _search_postgresql(tokens, kinds, limit, offset)
+    else:
+        rows = _search_fallback(tokens, kinds, limit, offset)
+    return [{'type': kind, 'id': object_id, 'title': title, 'snippet': snippet} for kind, object_id, title, snippet in rows]
+
+
+def _search_sqlite(tokens, kinds, limit, offset):
+    # Quoted tokens cannot be read as FTS5 operators, the trailing * makes the last one a prefix
+    match = ' '.join(f'"{token}"' for token in tokens) + '*'
+    placeholders = ', '.join(['%s'] * len(kinds))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT e.kind, e.object_id, e.title, snippet({FTS_TABLE}, 1, '', '', '…', {SNIPPET_WORDS})
+            FROM {FTS_TABLE} JOIN noctra_app_searchentry e ON e.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s AND e.kind IN ({placeholders})
+            ORDER BY bm25({FTS_TABLE}, 5.0, 1.0)
+            LIMIT %s OFFSET %s
+            """,
+            [match, *kinds, limit, offset],
+        )
+        return cursor.fetchall()
+
+
+def _search_postgresql(tokens, kinds, limit, offset):
+    query = ' & '.join(tokens) + ':*'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT e.kind, e.object_id, e.title,
+                   ts_headline('simple', e.body, q, 'StartSel="", StopSel="", MaxWords={SNIPPET_WORDS}, MinWords=4')
+            FROM noctra_app_searchentry e, to_tsquery('simple', %s) q
+            WHERE e.document @@ q AND e.kind = ANY(%s)
+            ORDER BY ts_rank_cd(e.document, q) DESC
+            LIMIT %s OFFSET %s
+            """,
+            [query, kinds, limit, offset],
+        )
+        return cursor.fetchall()
+
+
+def _search_fallback(tokens, kinds, limit, offset):
+    # No full-text index on this backend: substring matches, newest first
+    matches = SearchEntry.objects.filter(kind__in=kinds)
+    for token in tokens:
+        matches = matches.filter(Q(title__icontains=token) | Q(body__icontains=token))
+    rows = matches.order_by('-updated_at').values_list('kind', 'object_id', 'title', 'body')[offset:offset + limit]
+    return [(kind, object_id, title, ' '.join(body.split()[:SNIPPET_WORDS])) for kind, object_id, title, body in rows]
@@ -1,7 +1,23 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db import IntegrityError
 from rest_framework import serializers
 from .models import *
+from .tags import attach_tags, normalize_tag, resolve_tags
+from .tickets import get_available_tickets
 import base64
+import os
+
+def image_srcset(manifest, request=None):
+    # {"webp": "<url> 320w, <url> 640w", ...}: one srcset per format from a derivative manifest
+    candidates = {}
+    for variant in manifest.get('variants', []):
+        url = default_storage.url(variant['name'])
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        candidates.setdefault(variant['format'], []).append(f"{url} {variant['width']}w")
+    return {fmt: ', '.join(entries) for fmt, entries in candidates.items()}
+
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -36,10 +52,19 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     username = serializers.CharField()
+    profile_pic_srcset = serializers.SerializerMethodField()
+    cover_pic_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = UserProfile
-        fields = '__all__'
+        exclude = ['profile_pic_derivatives', 'cover_pic_derivatives']
+        read_only_fields = ['followers_count', 'following_count', 'unread_notifications']
+
+    def get_profile_pic_srcset(self, obj):
+        return image_srcset(obj.profile_pic_derivatives, self.context.get('request'))
+
+    def get_cover_pic_srcset(self, obj):
+        return image_srcset(obj.cover_pic_derivatives, self.context.get('request'))
 
 class ClubSerializer(serializers.ModelSerializer):
     class Meta:
@@ -50,6 +75,7 @@ class ClubProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = ClubProfile
         fields = '__all__'
+        read_only_fields = ['followers_count']
 
 class ClubAdminSerializer(serializers.ModelSerializer):
     class Meta:
@@ -60,6 +86,25 @@ class EventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
         fields = '__all__'
+        read_only_fields = ['shard_count']
+
+    def validate(self, attrs):
+        # A sharded inventory lives in its buckets, editing the counters directly would desync them
+        if self.instance and self.instance.shard_count:
+            for field in ('available_tickets', 'total_tickets'):
+                if field in attrs:
+                    raise serializers.ValidationError({field: "Inventory is sharded, switch it back to a single counter first."})
+        return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['available_tickets'] = get_available_tickets(instance)
+        return data
+
+class TicketSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Ticket
+        fields = '__all__'
 
 class FeedSerializer(serializers.ModelSerializer):
     class Meta:
@@ -67,28 +112,66 @@ class FeedSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class PostMediaSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+    hls_url = serializers.SerializerMethodField()
+    poster_url = serializers.SerializerMethodField()
+
     class Meta:
         model = PostMedia
-        fields = ['file', 'file_type']
+        fields = ['file', 'file_type', 'srcset', 'transcode_status', 'hls_url', 'poster_url']
+        read_only_fields = ['transcode_status']
+
+    def _media_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_srcset(self, obj):
+        return image_srcset(obj.derivatives, self.context.get('request'))
+
+    def get_hls_url(self, obj):
+        return self._media_url(obj.hls_manifest if obj.transcode_status == 'ready' else '')
+
+    def get_poster_url(self, obj):
+        return self._media_url(obj.poster)
         
+class MediaUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MediaUpload
+        fields = ['id', 'post', 'filename', 'total_size', 'received_size', 'status', 'media', 'error', 'created_at']
+        read_only_fields = ['received_size', 'status', 'media', 'error']
+
+    def validate_post(self, post):
+        if post.owner_id != self.context['request'].user.id:
+            raise serializers.ValidationError("You can only upload media to your own posts.")
+        return post
+
+    def validate_filename(self, filename):
+        return os.path.basename(filename)
+
+    def validate_total_size(self, total_size):
+        if not 0 < total_size <= settings.MEDIA_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"File size must be between 1 and {settings.MEDIA_UPLOAD_MAX_SIZE} bytes.")
+        return total_size
+
 class TagListSerializer(serializers.ListSerializer):
     def to_internal_value(self, data):
-        tag_objects = []
+        names = []
         errors = []
 
         for item in data:
-            name = item.get('name', '').lower()
+            name = normalize_tag(item.get('name', ''))
             if not name:
                 errors.append({'name': ['This field is required.']})
                 continue
-
-            obj, _ = Tag.objects.get_or_create(name=name)
-            tag_objects.append(obj)
+            names.append(name)
 
         if errors:
             raise serializers.ValidationError(errors)
 
-        return tag_objects
+        return resolve_tags(names)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -101,10 +184,15 @@ class PostSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, required=False)
     media = PostMediaSerializer(many=True, required=False)
     original_post = serializers.PrimaryKeyRelatedField(queryset=Post.objects.all(), required=False)
+    owner = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Post
-        fields = ['id', 'caption', 'tags', 'is_public', 'media', 'original_post']
+        fields = [
+            'id', 'owner', 'caption', 'tags', 'is_public', 'media', 'original_post', 'created_at',
+            'like_count', 'comment_count', 'repost_count',
+        ]
+        read_only_fields = ['created_at', 'like_count', 'comment_count', 'repost_count']
 
     def create(self, validated_data):
         is_public = validated_data.pop('is_public', None)
@@ -112,7 +200,9 @@ class PostSerializer(serializers.ModelSerializer):
         if isinstance(is_public, str):
             is_public = is_public.lower() == 'true'
         
+        tags = validated_data.pop('tags', [])
         post = Post.objects.create(**validated_data, is_public=is_public)
+        attach_tags(post, tags)
         return post
 
     def update(self, instance, validated_data):
@@ -124,7 +214,9 @@ class PostSerializer(serializers.ModelSerializer):
         instance.save()
 
         if tags:
-            instance.tags.set(tags)
+            # Replaces the explicit tags only, the caption's hashtags keep their links
+            Post.tags.through.objects.filter(post=instance, from_caption=False).exclude(tag__in=tags).delete()
+            attach_tags(instance, tags)
 
         for media in media_data:
             PostMedia.objects.create(post=instance, **media)
@@ -143,6 +235,17 @@ class FollowSerializer(serializers.ModelSerializer):
     class Meta:
         model = Follow
         fields = '__all__'
+        # The partial unique constraints are checked by the database, see FollowViewSet.perform_create
+        validators = []
+
+    def validate(self, data):
+        following_user = data.get('following_user', getattr(self.instance, 'following_user', None))
+        following_club = data.get('following_club', getattr(self.instance, 'following_club', None))
+        if bool(following_user) == bool(following_club):
+            raise serializers.ValidationError("Follow exactly one of following_user or following_club.")
+        if following_user is not None and following_user == data.get('follower', getattr(self.instance, 'follower', None)):
+            raise serializers.ValidationError({"following_user": "You cannot follow yourself."})
+        return data
 
 class LikeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -152,7 +255,22 @@ class LikeSerializer(serializers.ModelSerializer):
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = '__all__'
+        exclude = ['path']
+        read_only_fields = ['depth']
+
+    def validate(self, data):
+        parent = data.get('parent')
+        if self.instance is not None and 'parent' in data and parent != self.instance.parent:
+            raise serializers.ValidationError({"parent": "A comment cannot be moved to another thread."})
+        if parent is not None and 'post' in data and parent.post_id != data['post'].id:
+            raise serializers.ValidationError({"parent": "The parent comment belongs to another post."})
+        return data
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'kind', 'target', 'message', 'actors', 'actor_count', 'is_read', 'timestamp']
+        read_only_fields = fields
 
 class ReservationSerializer(serializers.ModelSerializer):
     class Meta:
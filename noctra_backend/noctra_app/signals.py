@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import *
+from .autocomplete import name_index
+from .follow_graph import adjacency, count_follow, follow_target
+from .media_pipeline import process_profile_images
+from .notifications import notifier
+from .profile_cache import invalidate_profile
+from .search import index_object, remove_object
+from .storage import content_store
+from .tickets import availability_publisher
 
 @receiver(post_save, sender=Club)
 def add_creator_to_club_admin(sender, instance, created, **kwargs):
@@ -31,6 +41,22 @@ def create_feed_for_user_profile(sender, instance, created, **kwargs):
         instance.feed = feed
         instance.save()
 
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    invalidate_profile(instance.id, instance.user_id)
+
+@receiver(post_save, sender=UserProfile)
+def generate_profile_image_derivatives(sender, instance, **kwargs):
+    process_profile_images(instance)
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_profile(sender, instance, **kwargs):
+    # Username changes show up in both cached shapes
+    profile = getattr(instance, 'profile', None)
+    if profile is not None:
+        invalidate_profile(profile.id, instance.id)
+
 @receiver(post_save, sender=ClubProfile)
 def create_feed_for_club_profile(sender, instance, created, **kwargs):
     if created and not instance.feed:
@@ -38,3 +64,212 @@ def create_feed_for_club_profile(sender, instance, created, **kwargs):
         instance.feed = feed
         instance.save()
 
+
+# Post counters
+def adjust_post_counter(post_id, field, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(**{f'{field}__gte': -delta})
+    posts.update(**{field: F(field) + delta})
+
+@receiver(post_save, sender=Like)
+def increment_like_count(sender, instance, created, **kwargs):
+    if created:
+        adjust_post_counter(instance.post_id, 'like_count', 1)
+
+@receiver(post_delete, sender=Like)
+def decrement_like_count(sender, instance, **kwargs):
+    adjust_post_counter(instance.post_id, 'like_count', -1)
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    if created:
+        adjust_post_counter(instance.post_id, 'comment_count', 1)
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, **kwargs):
+    adjust_post_counter(instance.post_id, 'comment_count', -1)
+
+@receiver(post_save, sender=Post)
+def increment_repost_count(sender, instance, created, **kwargs):
+    if created and instance.original_post_id:
+        adjust_post_counter(instance.original_post_id, 'repost_count', 1)
+
+@receiver(post_delete, sender=Post)
+def decrement_repost_count(sender, instance, **kwargs):
+    if instance.original_post_id:
+        adjust_post_counter(instance.original_post_id, 'repost_count', -1)
+
+
+# Media blob references
+MEDIA_FILE_FIELDS = {
+    PostMedia: ('file',),
+    UserProfile: ('profile_pic', 'cover_pic'),
+}
+
+def stored_file_names(instance):
+    # Read the raw values, so deferred fields are not loaded just for this
+    names = {}
+    for field in MEDIA_FILE_FIELDS[type(instance)]:
+        value = instance.__dict__.get(field)
+        names[field] = getattr(value, 'name', value)
+    return names
+
+@receiver(post_init, sender=PostMedia)
+@receiver(post_init, sender=UserProfile)
+def remember_media_files(sender, instance, **kwargs):
+    instance._stored_files = stored_file_names(instance)
+
+@receiver(post_save, sender=PostMedia)
+@receiver(post_save, sender=UserProfile)
+def release_replaced_media_files(sender, instance, **kwargs):
+    current = stored_file_names(instance)
+    for field, name in instance._stored_files.items():
+        if name and current[field] and name != current[field]:
+            content_store.release(name)
+    instance._stored_files = current
+
+@receiver(post_delete, sender=PostMedia)
+@receiver(post_delete, sender=UserProfile)
+def release_deleted_media_files(sender, instance, **kwargs):
+    for name in stored_file_names(instance).values():
+        content_store.release(name)
+
+
+# Search index, see search.py
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    index_object('post', instance)
+
+@receiver(post_save, sender=Club)
+def index_club(sender, instance, **kwargs):
+    index_object('club', instance)
+    # Event entries carry the club name
+    for event in instance.events.all():
+        index_object('event', event)
+
+@receiver(post_save, sender=ClubProfile)
+@receiver(post_delete, sender=ClubProfile)
+def index_club_profile(sender, instance, **kwargs):
+    club = Club.objects.filter(pk=instance.club_id).first()
+    if club:
+        index_object('club', club)
+
+@receiver(post_save, sender=Event)
+def index_event(sender, instance, **kwargs):
+    index_object('event', instance)
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Club)
+@receiver(post_delete, sender=Event)
+def remove_search_entry(sender, instance, **kwargs):
+    remove_object(sender._meta.model_name, instance.pk)
+
+
+# Type-ahead index, see autocomplete.py
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, **kwargs):
+    name_index.put('user', instance.profile.id, instance.username)
+
+@receiver(post_delete, sender=UserProfile)
+def unindex_username(sender, instance, **kwargs):
+    name_index.remove('user', instance.id)
+
+@receiver(post_save, sender=Club)
+def index_club_name(sender, instance, **kwargs):
+    name_index.put('club', instance.id, instance.name)
+
+@receiver(post_delete, sender=Club)
+def unindex_club_name(sender, instance, **kwargs):
+    name_index.remove('club', instance.id)
+
+def followed_key(follow):
+    if follow.following_user_id:
+        return 'user', follow.following_user_id
+    club_id = ClubProfile.objects.filter(pk=follow.following_club_id).values_list('club_id', flat=True).first()
+    return 'club', club_id
+
+@receiver(post_save, sender=Follow)
+def count_indexed_follower(sender, instance, created, **kwargs):
+    if created:
+        name_index.adjust_followers(*followed_key(instance), 1)
+
+@receiver(post_delete, sender=Follow)
+def uncount_indexed_follower(sender, instance, **kwargs):
+    name_index.adjust_followers(*followed_key(instance), -1)
+
+
+# Follow counters and the adjacency cache, see follow_graph.py
+
+def invalidate_follow_profiles(follow):
+    # The counters are part of the cached profile payloads, F() updates skip the UserProfile signals
+    profile_ids = [follow.follower_id] + ([follow.following_user_id] if follow.following_user_id else [])
+    for profile_id, user_id in UserProfile.objects.filter(pk__in=profile_ids).values_list('id', 'user_id'):
+        invalidate_profile(profile_id, user_id)
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        count_follow(instance, 1)
+        adjacency.update(follow_target(instance), instance.follower_id, True)
+        invalidate_follow_profiles(instance)
+
+@receiver(post_delete, sender=Follow)
+def count_removed_follow(sender, instance, **kwargs):
+    count_follow(instance, -1)
+    adjacency.update(follow_target(instance), instance.follower_id, False)
+    invalidate_follow_profiles(instance)
+
+
+# Notification events, written in bulk by notifications.py
+
+@receiver(post_save, sender=Like)
+def notify_like(sender, instance, created, **kwargs):
+    if created:
+        notifier.notify(instance.post.owner_id, 'like', f'post:{instance.post_id}', instance.user_id)
+
+@receiver(post_save, sender=Comment)
+def notify_comment(sender, instance, created, **kwargs):
+    if not created:
+        return
+    post_owner_id = instance.post.owner_id
+    if instance.parent_id:
+        parent_author_id = instance.parent.author_id
+        notifier.notify(parent_author_id, 'reply', f'comment:{instance.parent_id}', instance.author_id)
+        if parent_author_id == post_owner_id:
+            return
+    notifier.notify(post_owner_id, 'comment', f'post:{instance.post_id}', instance.author_id)
+
+@receiver(post_save, sender=Follow)
+def notify_follow(sender, instance, created, **kwargs):
+    # Club follows have no single owner to tell
+    if created and instance.following_user_id:
+        user_ids = dict(UserProfile.objects.filter(
+            pk__in=[instance.follower_id, instance.following_user_id]
+        ).values_list('id', 'user_id'))
+        notifier.notify(user_ids[instance.following_user_id], 'follow', 'followers', user_ids[instance.follower_id])
+
+@receiver(post_init, sender=Reservation)
+def remember_reservation_status(sender, instance, **kwargs):
+    instance._stored_status = instance.__dict__.get('status')
+
+@receiver(post_save, sender=Reservation)
+def notify_reservation_status(sender, instance, created, **kwargs):
+    previous = instance._stored_status
+    if not created and previous is not None and instance.status not in (previous, 'pending'):
+        notifier.notify(
+            instance.user_id, 'reservation', f'reservation:{instance.pk}',
+            message=f"Your reservation for {instance.event.name} was {instance.status}",
+        )
+    instance._stored_status = instance.status
+
+
+# Live ticket counts, see tickets.py
+
+@receiver(post_save, sender=Event)
+def publish_ticket_count(sender, instance, created, **kwargs):
+    # Edits by the club (more tickets released, say) reach the clients following the event
+    if not created:
+        transaction.on_commit(lambda: availability_publisher.touch(instance.pk))
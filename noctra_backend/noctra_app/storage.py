@@ -0,0 +1,102 @@
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every distinct file once, under blobs/<d0d1>/<d2d3>/<sha256><ext>.
+    The name from upload_to only contributes the extension. Each save is one reference
+    in MediaBlob, and release() deletes the blob with its derivatives when the last one goes.
+    Placing and unlinking a blob's files both happen under a lock on its MediaBlob row.
+    """
+    prefix = 'blobs'
+
+    def get_available_name(self, name, max_length=None):
+        # Identical content maps to the same name on purpose
+        return name
+
+    def _save(self, name, content):
+        from .models import MediaBlob
+
+        extension = os.path.splitext(name)[1].lower()
+        staging = self.path(os.path.join(self.prefix, 'staging'))
+        os.makedirs(staging, exist_ok=True)
+
+        # Hash while streaming to disk, the file is never held in memory
+        digest = hashlib.sha256()
+        size = 0
+        descriptor, staged_path = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(descriptor, 'wb') as staged:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    staged.write(chunk)
+                    size += len(chunk)
+
+            hexdigest = digest.hexdigest()
+            blob_name = f'{self.prefix}/{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{extension}'
+            blob_path = self.path(blob_name)
+            with transaction.atomic():
+                # The row stays locked until the file is in place, a concurrent _reap() waits
+                MediaBlob.acquire(hexdigest, blob_name, size)
+                if os.path.exists(blob_path):
+                    os.remove(staged_path)
+                else:
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    os.replace(staged_path, blob_path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(blob_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+            raise
+        return blob_name
+
+    def is_blob(self, name):
+        return bool(name) and name.startswith(f'{self.prefix}/')
+
+    def release(self, name):
+        # Drops one reference, the last one removes the blob and every derivative generated next to it
+        from .models import MediaBlob
+
+        if not self.is_blob(name):
+            return
+        digest = os.path.splitext(os.path.basename(name))[0]
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(pk=digest, ref_count__gt=0).first()
+            if blob is None:
+                return
+            MediaBlob.objects.filter(pk=digest).update(ref_count=F('ref_count') - 1)
+            if blob.ref_count == 1:
+                # The unreferenced row is kept until then, so an upload of the same bytes
+                # in the meantime takes it back instead of racing the unlink
+                transaction.on_commit(lambda: self._reap(name, digest))
+
+    def _reap(self, name, digest):
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            if not MediaBlob.objects.select_for_update().filter(pk=digest, ref_count=0).exists():
+                return  # acquired again since
+            # Deleted before the files so SQLite, which has no row locks, takes its write lock first
+            MediaBlob.objects.filter(pk=digest, ref_count=0).delete()
+            for path in glob.glob(os.path.join(os.path.dirname(self.path(name)), f'{digest}*')):
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)  # HLS renditions
+                else:
+                    os.remove(path)
+
+
+content_store = ContentAddressedStorage()
+
+
+def get_content_store():
+    # Callable storage keeps the migrations independent of the storage instance
+    return content_store
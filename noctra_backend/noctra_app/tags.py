@@ -0,0 +1,39 @@
+from .models import Post, Tag
+
+
+def normalize_tag(name):
+    # Same lowercasing as Tag.save, plus the leading # people type in the app
+    return name.strip().lstrip('#').strip().lower()
+
+
+def resolve_tags(names):
+    """
+    Returns the Tag rows for `names` in first-seen order, creating the missing ones.
+    Three queries whatever the number of tags, and concurrent creators of the same tag
+    cannot collide on the unique name because conflicting inserts are ignored.
+    """
+    wanted = list(dict.fromkeys(name for name in map(normalize_tag, names) if name))
+    if not wanted:
+        return []
+
+    existing = {tag.name: tag for tag in Tag.objects.filter(name__in=wanted)}
+    missing = [Tag(name=name) for name in wanted if name not in existing]
+    if missing:
+        # bulk_create skips Tag.save, the names are already lowercase
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        # ignore_conflicts leaves the primary keys unset, so read the new rows back
+        existing.update((tag.name, tag) for tag in Tag.objects.filter(name__in=[tag.name for tag in missing]))
+    return [existing[name] for name in wanted]
+
+
+def attach_tags(post, tags, from_caption=False):
+    # One insert into the through table. Links the post already has are skipped by hashtags,
+    # an explicit tag takes over a hashtag's link so it stays when the hashtag goes.
+    Through = Post.tags.through
+    conflicts = {'ignore_conflicts': True} if from_caption else {
+        'update_conflicts': True, 'unique_fields': ['post', 'tag'], 'update_fields': ['from_caption'],
+    }
+    Through.objects.bulk_create(
+        [Through(post_id=post.pk, tag_id=tag.pk, from_caption=from_caption) for tag in tags],
+        **conflicts,
+    )
@@ -0,0 +1,111 @@
+import atexit
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher:
+    """
+    Runs `func` every `interval` seconds on a daemon thread, and one last time when the process exits.
+    Used by the in-process write buffers so they never need a separate scheduler.
+    """
+
+    def __init__(self, func, interval, name):
+        self.func = func
+        self.interval = interval
+        self.name = name
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name=self.name, daemon=True).start()
+        atexit.register(self.run_once)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
+
+    def run_once(self):
+        try:
+            self.func()
+        except Exception:
+            logger.exception("%s flush failed", self.name)
+        finally:
+            close_old_connections()
+
+
+# Local worker queue for work that should not hold up the request
+
+_executors = {}
+_process_pool = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(queue):
+    # One pool per named queue, so slow jobs (video transcodes) cannot starve the quick ones
+    with _executor_lock:
+        if queue not in _executors:
+            workers = settings.BACKGROUND_QUEUE_WORKERS.get(queue, settings.BACKGROUND_WORKERS)
+            _executors[queue] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'noctra-{queue}')
+        return _executors[queue]
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background task %s failed", func.__name__)
+    finally:
+        close_old_connections()
+
+
+def enqueue(func, *args, queue='default'):
+    # BACKGROUND_TASKS_EAGER runs the task inline, which tests and management commands rely on
+    if settings.BACKGROUND_TASKS_EAGER:
+        func(*args)
+        return
+    _get_executor(queue).submit(_run, func, *args)
+
+
+def _get_process_pool():
+    global _process_pool
+    with _executor_lock:
+        if _process_pool is None:
+            # spawn, not fork: the web process has threads and open database connections
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.BACKGROUND_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def _hand_back(future, then, args):
+    try:
+        result = future.result()
+    except Exception:
+        logger.exception("Background process task failed")
+        return
+    enqueue(then, *args, result)
+
+
+def run_in_process(func, args, then, *then_args):
+    """
+    Runs the CPU-bound func(*args) in the process pool, then then(*then_args, result) on the worker queue.
+    func must be importable without Django set up, since the pool does not share the web process state.
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        then(*then_args, func(*args))
+        return
+    future = _get_process_pool().submit(func, *args)
+    future.add_done_callback(lambda done: _hand_back(done, then, then_args))
@@ -1,3 +1,1069 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .autocomplete import PrefixIndex
+from .captions import extract_entities, process_caption
+from .follow_graph import AdjacencyCache, is_following
+from .like_buffer import like_buffer
+from .models import (
+    Club, ClubProfile, Comment, Event, Follow, Like, MediaBlob, Mention, Notification, Post, PostMedia, Reservation,
+    Tag, Ticket,
+)
+from .notifications import notifier
+from .realtime import websocket_application
+from .recommendations import build_recommendations
+from .serializers import PostSerializer
+from .tags import attach_tags, resolve_tags
+from .tickets import SoldOut, availability_publisher, purchase_tickets, refresh_available_tickets, set_inventory_shards
+from .timeline import fan_out_post
+from .transcoding import hls_command, rendition_ladder, transcode_video
+from .trending import TrendingIndex
+
+
+class PostListQueryCountTests(APITestCase):
+    """
+    Post listings must cost a fixed number of queries whatever the page size,
+    so an N+1 sneaking into PostSerializer or the post querysets fails here.
+    """
+    PAGE_SIZES = (1, 10, 50)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='password123')
+        tags = [Tag.objects.create(name=f'tag{i}') for i in range(3)]
+        for i in range(max(cls.PAGE_SIZES)):
+            post = Post.objects.create(owner=cls.user, caption=f'Post {i}')
+            post.tags.add(*tags)
+            post.mentions.add(cls.user)
+            PostMedia.objects.create(post=post, file=f'images/posts/owner/{i}.jpg')
+            fan_out_post(post)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assertQueriesPerPage(self, url, expected):
+        for page_size in self.PAGE_SIZES:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+            self.assertEqual(
+                len(ctx.captured_queries), expected,
+                f"{url} with page_size={page_size} ran {len(ctx.captured_queries)} queries, expected {expected}",
+            )
+
+    def test_post_list(self):
+        self.assertQueriesPerPage('/api/posts/', 4)
+
+    def test_user_posts(self):
+        self.assertQueriesPerPage(f'/api/posts/user/{self.user.id}/', 4)
+
+    def test_timeline(self):
+        self.assertQueriesPerPage(f'/api/feeds/{self.user.profile.feed_id}/timeline/', 9)
+
+
+class TimelineTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.club_owner = (
+            User.objects.create_user(username=name) for name in ('author', 'reader', 'club_owner')
+        )
+        club = Club.objects.create(name='Club', main_location='x', contact_number='0', created_by=cls.club_owner)
+        Follow.objects.create(follower=cls.reader.profile, following_user=cls.author.profile)
+        Follow.objects.create(follower=cls.reader.profile, following_club=ClubProfile.objects.create(club=club))
+
+    def read_all(self, feed_id):
+        captions = []
+        url = f'/api/feeds/{feed_id}/timeline/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            captions += [post['caption'] for post in response.data['results']]
+            url = response.data['next']
+        return captions
+
+    def test_followed_accounts_and_clubs(self):
+        self.client.force_authenticate(self.author)
+        for i in range(5):
+            self.assertEqual(self.client.post('/api/posts/', {'caption': f'author {i}'}, format='multipart').status_code, 201)
+        self.client.force_authenticate(self.club_owner)
+        for i in range(3):
+            self.client.post('/api/posts/', {'caption': f'club {i}'}, format='multipart')
+
+        # Following the club is not following its creator
+        Post.objects.create(owner=self.club_owner, caption='private', is_public=False)
+
+        self.client.force_authenticate(self.reader)
+        captions = self.read_all(self.reader.profile.feed_id)
+        self.assertEqual(sorted(captions), sorted([f'author {i}' for i in range(5)] + [f'club {i}' for i in range(3)]))
+        self.assertEqual(self.client.get(f'/api/feeds/{self.author.profile.feed_id}/timeline/').status_code, 403)
+
+
+class KeysetPaginationTests(APITestCase):
+    def test_pages_cover_every_post_newest_first(self):
+        owner = User.objects.create_user(username='owner')
+        for i in range(45):
+            Post.objects.create(owner=owner, caption=str(i))
+        self.client.force_authenticate(owner)
+
+        captions = []
+        url = f'/api/posts/user/{owner.id}/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            captions += [post['caption'] for post in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(captions, [str(i) for i in reversed(range(45))])
+
+        self.assertEqual(self.client.get('/api/posts/', {'cursor': 'zzz'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/comments/').data, {'next': None, 'results': []})
+
+
+class PostCounterTests(APITestCase):
+    def test_counters_follow_likes_comments_and_reposts(self):
+        owner = User.objects.create_user(username='owner')
+        self.client.force_authenticate(owner)
+        post = Post.objects.create(owner=owner, caption='x')
+        self.assertEqual(self.client.post('/api/likes/', {'post': post.id, 'user': owner.id}).status_code, 201)
+        self.assertEqual(self.client.post('/api/comments/', {'post': post.id, 'author': owner.id, 'text': 'hi'}).status_code, 201)
+        Post.objects.create(owner=owner, caption='re', original_post=post)
+
+        # A save of a stale instance does not write old counts back
+        post.caption = 'edited'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual((post.like_count, post.comment_count, post.repost_count, post.caption), (1, 1, 1, 'edited'))
+
+        Post.objects.filter(pk=post.pk).update(like_count=9)
+        call_command('reconcile_post_counters', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 1)
+
+        Like.objects.all().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 0)
+
+
+class LikeEndpointTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user(username='fan'))
+
+    def test_bad_post_ids_are_rejected(self):
+        for post in ('abc', '', '999999'):
+            response = self.client.get('/api/likes/status/', {'post': post})
+            self.assertEqual(response.status_code, 400, post)
+        self.assertEqual(self.client.post('/api/likes/unlike/', {'post': 'abc'}).status_code, 400)
+
+    @override_settings(LIKE_BUFFER_ENABLED=True)
+    def test_buffered_likes(self):
+        owner, fan = User.objects.create_user(username='owner'), User.objects.create_user(username='other')
+        post = Post.objects.create(owner=owner, caption='x')
+        self.client.force_authenticate(owner)
+
+        def status():
+            data = self.client.get('/api/likes/status/', {'post': post.id}).data
+            return data['liked'], data['like_count']
+
+        with patch.object(like_buffer, '_flusher'):
+            self.assertEqual(self.client.post('/api/likes/', {'post': post.id}).status_code, 202)
+            # The caller sees their own pending like before it is written
+            self.assertEqual(status(), (True, 1))
+            like_buffer.like(post.id, fan.id)
+            like_buffer.unlike(post.id, fan.id)
+            like_buffer.like(post.id, fan.id)
+            self.assertEqual(like_buffer.flush(), 2)
+            post.refresh_from_db()
+            self.assertEqual((post.like_count, Like.objects.count()), (2, 2))
+
+            self.assertEqual(self.client.post('/api/likes/unlike/', {'post': post.id}).status_code, 202)
+            self.assertEqual(status(), (False, 1))
+            like_buffer.flush()
+            post.refresh_from_db()
+            self.assertEqual((post.like_count, Like.objects.count()), (1, 1))
+
+    def test_batch_being_written_stays_visible(self):
+        owner = User.objects.create_user(username='owner')
+        post = Post.objects.create(owner=owner, caption='x')
+        seen = []
+
+        def write(pending):
+            # The Like row does not exist yet, the status endpoint still needs the pending state
+            seen.append(like_buffer.pending_state(post.id, owner.id))
+
+        with patch.object(like_buffer, '_flusher'), patch.object(like_buffer, '_write', write):
+            like_buffer.like(post.id, owner.id)
+            like_buffer.flush()
+        self.assertEqual(seen, [True])
+        self.assertIsNone(like_buffer.pending_state(post.id, owner.id))
+
+
+class TicketPurchaseTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user(username='buyer')
+        cls.club = Club.objects.create(name='Club', main_location='x', contact_number='0', created_by=cls.buyer)
+
+    def make_event(self, tickets):
+        return Event.objects.create(
+            club=self.club, name='Night', date=timezone.now() + timedelta(days=1), ticket_price=10,
+            total_tickets=tickets, available_tickets=tickets,
+        )
+
+    def test_sells_out_without_overselling(self):
+        event = self.make_event(3)
+        purchase_tickets(self.buyer, event, 2)
+        with self.assertRaises(SoldOut):
+            purchase_tickets(self.buyer, event, 2)
+        event.refresh_from_db()
+        self.assertEqual(event.available_tickets, 1)
+
+    def test_purchase_endpoint(self):
+        event = self.make_event(3)
+        self.client.force_authenticate(self.buyer)
+        url = f'/api/events/{event.id}/purchase/'
+        response = self.client.post(url, {'quantity': 2})
+        self.assertEqual((response.status_code, len(response.data)), (201, 2))
+        self.assertEqual(self.client.post(url, {'quantity': 2}).status_code, 409)
+        self.assertEqual(self.client.post(url, {'quantity': 'x'}).status_code, 400)
+
+    def test_sharded_inventory(self):
+        event = self.make_event(10)
+        event.created_by = self.buyer
+        event.save()
+        self.client.force_authenticate(self.buyer)
+        url = f'/api/events/{event.id}/inventory/'
+
+        response = self.client.post(url, {'shards': 4})
+        self.assertEqual((response.data['shard_count'], response.data['available_tickets']), (4, 10))
+        self.assertEqual(sorted(event.inventory_shards.values_list('available', flat=True)), [2, 2, 3, 3])
+        event.refresh_from_db()
+        purchase_tickets(self.buyer, event, 9)
+        with self.assertRaises(SoldOut):
+            purchase_tickets(self.buyer, event, 2)
+        # The counter of a sharded event is derived from the buckets
+        self.assertEqual(self.client.patch(f'/api/events/{event.id}/', {'available_tickets': 3}).status_code, 400)
+
+        response = self.client.post(url, {'shards': 0})
+        self.assertEqual((response.data['shard_count'], response.data['available_tickets']), (0, 1))
+
+    def test_door_check_in(self):
+        staff = User.objects.create_user(username='door', is_staff=True)
+        event = self.make_event(600)
+        for _ in range(50):
+            purchase_tickets(staff, event, 10)
+        codes = list(Ticket.objects.values_list('qr_code', flat=True))
+        self.client.force_authenticate(staff)
+
+        def validate(codes, **extra):
+            return self.client.post(
+                '/api/tickets/validate/', {'codes': codes, 'club': str(self.club.id), **extra}, format='json',
+            )
+
+        # A whole batch costs the same queries as two codes
+        with CaptureQueriesContext(connection) as small:
+            validate(codes[:2], event=str(event.id))
+        with CaptureQueriesContext(connection) as large:
+            response = validate(codes[2:] + ['nope', codes[2]], event=str(event.id))
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses.count('admitted'), 498)
+        self.assertEqual(statuses[-2:], ['not_found', 'already_used'])
+        self.assertEqual([result['status'] for result in validate(codes[:2]).data['results']], ['already_used'] * 2)
+        self.assertEqual(self.client.post(
+            '/api/tickets/validate/', {'codes': codes[:2], 'club': 'bad'}, format='json',
+        ).status_code, 400)
+
+    def test_stale_event_follows_the_shard_switch(self):
+        event = self.make_event(10)
+        stale = Event.objects.get(pk=event.pk)
+        set_inventory_shards(event, 4)
+
+        purchase_tickets(self.buyer, stale, 3)
+        self.assertEqual(refresh_available_tickets(event), 7)
+
+        # And back to the single counter
+        set_inventory_shards(event, 0)
+        purchase_tickets(self.buyer, stale, 2)
+        event.refresh_from_db()
+        self.assertEqual(event.available_tickets, 5)
+
+
+class ProfileCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'u{i}') for i in range(30)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.users[0])
+
+    def test_etag_and_invalidation(self):
+        response = self.client.get('/api/userprofiles/me/')
+        self.assertEqual(response.data['username'], 'u0')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/userprofiles/me/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.assertEqual(self.client.patch('/api/userprofiles/me/', {'bio': 'hello'}).status_code, 200)
+        response = self.client.get('/api/userprofiles/me/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response.data['bio']), (200, 'hello'))
+
+        other = self.users[1]
+        url = f'/api/userprofiles/{other.profile.id}/'
+        self.assertEqual(self.client.get(url).data['username'], 'u1')
+        other.username = 'renamed'
+        other.save()
+        self.assertEqual(self.client.get(url).data['username'], 'renamed')
+        self.assertEqual(self.client.get('/api/userprofiles/99999/').status_code, 404)
+
+    def test_batch(self):
+        ids = [user.profile.id for user in self.users]
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/userprofiles/batch/', {'ids': ','.join(map(str, ids + [99999]))})
+        self.assertEqual((len(response.data), response.data[3]['username']), (30, 'u3'))
+        with self.assertNumQueries(0):
+            self.client.post('/api/userprofiles/batch/', {'ids': ids}, format='json')
+        self.assertEqual(self.client.get('/api/userprofiles/batch/', {'ids': 'a,b'}).status_code, 400)
+
+
+class TemporaryMediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ChunkedUploadTests(TemporaryMediaRootMixin, APITestCase):
+    def test_resumable_upload(self):
+        owner = User.objects.create_user(username='owner')
+        post = Post.objects.create(owner=owner, caption='x')
+        self.client.force_authenticate(owner)
+        data = os.urandom(300_000)
+
+        response = self.client.post(
+            '/api/uploads/', {'post': post.id, 'filename': '../clip.MP4', 'total_size': len(data)}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        chunk_url = f"/api/uploads/{response.data['id']}/chunk/"
+        finalize_url = f"/api/uploads/{response.data['id']}/finalize/"
+
+        response = self.client.put(f'{chunk_url}?offset=0', data[:100_000], content_type='application/octet-stream')
+        self.assertEqual(response.data['received_size'], 100_000)
+        # A retried chunk is refused with the offset to resume from
+        response = self.client.put(f'{chunk_url}?offset=0', data[:100_000], content_type='application/octet-stream')
+        self.assertEqual((response.status_code, response.data['received_size']), (409, 100_000))
+        self.assertEqual(self.client.post(finalize_url).status_code, 400)
+
+        response = self.client.put(f'{chunk_url}?offset=100000', data[100_000:], content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 200)
+        with patch('noctra_app.transcoding.logger'):  # quiet where ffmpeg is not installed
+            response = self.client.post(finalize_url)
+        self.assertEqual((response.status_code, response.data['status']), (202, 'done'))
+
+        media = PostMedia.objects.get()
+        self.assertEqual(media.file_type, 'video')
+        self.assertTrue(media.file.name.startswith('blobs/'))
+        with media.file.open('rb') as stored:
+            self.assertEqual(stored.read(), data)
+
+        # Someone else's post or upload
+        self.client.force_authenticate(User.objects.create_user(username='other'))
+        response = self.client.post('/api/uploads/', {'post': post.id, 'filename': 'x.jpg', 'total_size': 5}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(chunk_url.replace('chunk/', '')).status_code, 404)
+
+
+def jpeg(color, size=(400, 300)):
+    image = io.BytesIO()
+    Image.new('RGB', size, color).save(image, 'JPEG')
+    return image.getvalue()
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class MediaStoreTests(TemporaryMediaRootMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner')
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, content):
+        return self.client.post(
+            '/api/posts/', {'caption': 'x', 'media': SimpleUploadedFile('a.JPG', content)}, format='multipart',
+        )
+
+    def test_derivatives(self):
+        self.assertEqual(self.upload(jpeg('red', (1200, 800))).status_code, 201)
+        self.assertEqual(len(PostMedia.objects.get().derivatives['variants']), 4)
+
+        response = self.client.patch(
+            '/api/userprofiles/me/', {'profile_pic': SimpleUploadedFile('p.jpg', jpeg('red'))}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.client.get(f'/api/userprofiles/{self.owner.profile.id}/').data['profile_pic_srcset']['webp'])
+
+    def test_identical_files_are_stored_once(self):
+        content = jpeg('red')
+        for _ in range(3):
+            self.upload(content)
+        name, = set(PostMedia.objects.values_list('file', flat=True))
+        self.assertTrue(name.startswith('blobs/') and name.endswith('.jpg'))
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        path = os.path.join(self.media_root, name)
+        self.assertTrue(os.path.exists(path.replace('.jpg', '_w320.webp')))
+
+        def set_profile_pic(content):
+            self.client.patch('/api/userprofiles/me/', {'profile_pic': SimpleUploadedFile('p.jpg', content)}, format='multipart')
+            blob.refresh_from_db()
+            return blob.ref_count
+
+        self.assertEqual(set_profile_pic(content), 4)
+        self.assertEqual(set_profile_pic(jpeg('blue')), 3)
+
+        # The last reference takes the file and its derivatives along
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.all().delete()
+        self.assertFalse(MediaBlob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(os.path.exists(path) or os.path.exists(path.replace('.jpg', '_w320.webp')))
+        self.assertEqual(MediaBlob.objects.count(), 1)
+
+    def test_upload_racing_the_last_release_keeps_the_file(self):
+        content = jpeg('red')
+        self.upload(content)
+        name = PostMedia.objects.get().file.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            Post.objects.all().delete()
+        # The same bytes come back before the unlink runs
+        self.upload(content)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+
+
+class MediaServingTests(TemporaryMediaRootMixin, APITestCase):
+    digest = 'ab' * 32
+
+    def write(self, name, data=b'data'):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as media_file:
+            media_file.write(data)
+
+    def get(self, name, **headers):
+        response = self.client.get(f'/media/{name}', **headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, content
+
+    def test_conditional_and_range_requests(self):
+        data = bytes(range(256)) * 40
+        self.write('video.mp4', data)
+        response, content = self.get('video.mp4')
+        self.assertEqual((response.status_code, content), (200, data))
+        self.assertEqual(self.get('video.mp4', HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+
+        response, content = self.get('video.mp4', HTTP_RANGE='bytes=100-199')
+        self.assertEqual((response.status_code, content), (206, data[100:200]))
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(data)}')
+        self.assertEqual(self.get('video.mp4', HTTP_RANGE='bytes=-10')[1], data[-10:])
+        self.assertEqual(self.get('video.mp4', HTTP_RANGE='bytes=99999-')[0].status_code, 416)
+
+        self.assertEqual(self.get('../manage.py')[0].status_code, 404)
+        self.assertEqual(self.get('nope.jpg')[0].status_code, 404)
+        with override_settings(MEDIA_OFFLOAD='x-accel-redirect'):
+            self.assertEqual(self.get('video.mp4')[0]['X-Accel-Redirect'], '/protected-media/video.mp4')
+
+    def test_files_being_written_are_not_served(self):
+        for name in (f'uploads/partial/{"c" * 32}.part', 'blobs/staging/tmpa1b2c3'):
+            self.write(name)
+            self.assertEqual(self.get(name)[0].status_code, 404)
+            self.assertEqual(self.get(f'images/../{name}')[0].status_code, 404)
+
+    def test_only_blobs_are_immutable(self):
+        blob = f'blobs/ab/ab/{self.digest}'
+        for name in (f'{blob}.jpg', f'{blob}_w320.webp', f'{blob}_poster.jpg', f'{blob}_hls/master.m3u8'):
+            self.write(name)
+            self.assertIn('immutable', self.get(name)[0]['Cache-Control'])
+
+        self.write(f'images/posts/{"c" * 32}.jpg')
+        self.assertEqual(self.get(f'images/posts/{"c" * 32}.jpg')[0]['Cache-Control'], 'public, no-cache')
+
+
+class TranscodingTests(TemporaryMediaRootMixin, APITestCase):
+    name = f'blobs/ab/ab/{"ab" * 32}.mp4'
+
+    def setUp(self):
+        super().setUp()
+        post = Post.objects.create(owner=User.objects.create_user(username='owner'), caption='x')
+        self.media = PostMedia.objects.create(post=post, file=self.name, transcode_status='pending')
+        self.commands = []
+
+    def fake_run(self, streams, during=None):
+        # Stands in for ffprobe/ffmpeg: writes what the real binaries would
+        def run(command, **kwargs):
+            self.commands.append(command)
+            self.assertEqual(PostMedia.objects.get().transcode_status, 'processing')
+            if during:
+                during(command)
+            if command[0] == settings.FFPROBE_BINARY:
+                return subprocess.CompletedProcess(command, 0, stdout=json.dumps({'streams': streams}).encode())
+            output = command[-1]
+            if output.endswith('.m3u8'):
+                output = os.path.join(os.path.dirname(output), 'master.m3u8')
+            with open(output, 'wb') as written:
+                written.write(b'x')
+            return subprocess.CompletedProcess(command, 0)
+        return patch('noctra_app.transcoding.subprocess.run', side_effect=run)
+
+    def test_rendition_ladder(self):
+        self.assertEqual([rung[0] for rung in rendition_ladder(1080)], [360, 720, 1080])
+        self.assertEqual([rung[0] for rung in rendition_ladder(800)], [360, 720])
+        # Below the smallest rung, one rendition at the source's (even) height
+        self.assertEqual(rendition_ladder(241), [(240, '800k', '96k')])
+
+    @staticmethod
+    def maps(command):
+        return [command[index + 1] for index, arg in enumerate(command) if arg == '-map']
+
+    def test_hls_command(self):
+        renditions = rendition_ladder(720)
+        command = hls_command('in.mp4', 'out', renditions, has_audio=True, threads=2)
+        self.assertEqual(self.maps(command), ['[v0out]', '0:a:0', '[v1out]', '0:a:0'])
+        self.assertEqual(command[command.index('-var_stream_map') + 1], 'v:0,a:0 v:1,a:1')
+        self.assertIn('[0:v]split=2[v0][v1];[v0]scale=-2:360[v0out];[v1]scale=-2:720[v1out]', command)
+        self.assertEqual(command[-1], os.path.join('out', 'stream_%v.m3u8'))
+
+        command = hls_command('in.mp4', 'out', renditions, has_audio=False, threads=2)
+        self.assertEqual(self.maps(command), ['[v0out]', '[v1out]'])
+        self.assertEqual(command[command.index('-var_stream_map') + 1], 'v:0 v:1')
+        self.assertNotIn('aac', command)
+
+    def test_ready(self):
+        with self.fake_run([{'codec_type': 'video', 'height': 720}, {'codec_type': 'audio'}]):
+            transcode_video(self.media.id)
+        self.media.refresh_from_db()
+        self.assertEqual(
+            (self.media.transcode_status, self.media.hls_manifest, self.media.poster),
+            ('ready', f'{self.name[:-4]}_hls/master.m3u8', f'{self.name[:-4]}_poster.jpg'),
+        )
+        self.assertEqual(len(self.commands), 3)  # probe, packaging, poster
+
+        # A job that was already claimed does nothing
+        with self.fake_run([]):
+            transcode_video(self.media.id)
+        self.assertEqual(len(self.commands), 3)
+
+    def test_failed(self):
+        def fail(command):
+            if command[0] == settings.FFMPEG_BINARY:
+                raise subprocess.CalledProcessError(1, command, stderr=b'broken')
+        video = [{'codec_type': 'video', 'height': 720}]
+        with self.fake_run(video, during=fail), patch('noctra_app.transcoding.logger') as logger:
+            transcode_video(self.media.id)
+        self.assertEqual(PostMedia.objects.get().transcode_status, 'failed')
+        self.assertIn('broken', logger.error.call_args[0][-1])
+        # No half written renditions are left behind
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'blobs/ab/ab')), [])
+
+        # No video stream at all
+        PostMedia.objects.update(transcode_status='pending')
+        with self.fake_run([{'codec_type': 'audio'}]), patch('noctra_app.transcoding.logger'):
+            transcode_video(self.media.id)
+        self.assertEqual(PostMedia.objects.get().transcode_status, 'failed')
+
+    def test_results_for_a_replaced_file_are_dropped(self):
+        def replace_file(command):
+            PostMedia.objects.update(file='blobs/cd/cd/other.mp4')
+        with self.fake_run([{'codec_type': 'video', 'height': 360}], during=replace_file):
+            transcode_video(self.media.id)
+        media = PostMedia.objects.get()
+        self.assertEqual((media.transcode_status, media.hls_manifest, media.poster), ('processing', '', ''))
+
+
+class TagResolverTests(APITestCase):
+    def test_resolve_and_attach_in_fixed_queries(self):
+        user = User.objects.create_user(username='tagger', password='password123')
+        post = Post.objects.create(owner=user, caption='Tagged')
+        Tag.objects.create(name='techno')
+        names = ['#Techno', 'house', 'HOUSE', ' afterparty '] + [f'tag{i}' for i in range(12)]
+
+        with CaptureQueriesContext(connection) as ctx:
+            attach_tags(post, resolve_tags(names))
+        # existing lookup, bulk insert, read back, through-table insert
+        self.assertEqual(len(ctx.captured_queries), 4)
+        self.assertEqual(
+            sorted(post.tags.values_list('name', flat=True)),
+            sorted(['techno', 'house', 'afterparty'] + [f'tag{i}' for i in range(12)]),
+        )
+        self.assertEqual(Tag.objects.filter(name='techno').count(), 1)
+
+        # Re-attaching is a no-op rather than an IntegrityError
+        attach_tags(post, resolve_tags(['techno', 'house']))
+        self.assertEqual(post.tags.count(), 15)
+
+
+class CaptionProcessingTests(APITestCase):
+    def setUp(self):
+        # Notifications are flushed by hand, not by the background thread
+        patcher = patch.object(notifier, '_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.owner = User.objects.create_user(username='host', password='password123')
+        self.ana = User.objects.create_user(username='ana.b', password='password123')
+        self.leo = User.objects.create_user(username='leo', password='password123')
+
+    def test_extract_entities(self):
+        self.assertEqual(
+            extract_entities('Thanks @ana.b and @leo! #Techno #techno mail me at x@y.com #afterparty.'),
+            (['ana.b', 'leo'], ['techno', 'afterparty']),
+        )
+
+    def test_edit_applies_only_the_diff(self):
+        post = Post.objects.create(owner=self.owner, caption='With @ana.b and @ghost #techno')
+        with self.captureOnCommitCallbacks(execute=True):
+            process_caption(post)
+        notifier.flush()
+        self.assertEqual(list(post.mentions.all()), [self.ana])
+        self.assertEqual(Notification.objects.filter(user=self.ana).count(), 1)
+
+        previous = post.caption
+        post.caption = 'With @ana.b and @leo #house'
+        post.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            process_caption(post, previous)
+        notifier.flush()
+
+        self.assertEqual(set(post.mentions.all()), {self.ana, self.leo})
+        self.assertEqual(Mention.objects.filter(post=post).count(), 2)
+        self.assertEqual(list(post.tags.values_list('name', flat=True)), ['house'])
+        # ana was already mentioned, so only leo hears about the edit
+        self.assertEqual(Notification.objects.filter(user=self.ana).count(), 1)
+        self.assertEqual(Notification.objects.filter(user=self.leo).count(), 1)
+
+    def test_removing_a_hashtag_keeps_explicit_tags(self):
+        post = Post.objects.create(owner=self.owner, caption='#techno #house #disco')
+        attach_tags(post, resolve_tags(['techno']))
+        process_caption(post)
+        attach_tags(post, resolve_tags(['house']))  # explicit after the hashtag linked it
+
+        previous = post.caption
+        post.caption = 'No tags'
+        post.save()
+        process_caption(post, previous)
+        self.assertEqual(set(post.tags.values_list('name', flat=True)), {'techno', 'house'})
+
+    def test_explicit_tags_replace_only_explicit_links(self):
+        post = Post.objects.create(owner=self.owner, caption='hi #techno')
+        process_caption(post)
+        attach_tags(post, resolve_tags(['disco']))
+
+        serializer = PostSerializer(post, data={'tags': [{'name': 'house'}]}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(set(post.tags.values_list('name', flat=True)), {'techno', 'house'})
+
+
+class TrendingIndexTests(APITestCase):
+    def test_recent_use_outranks_older_use(self):
+        index = TrendingIndex(half_life=3600, window=86400, snapshot_interval=0, resync_interval=3600, size=10)
+        index._synced_at = time.time()
+        now = time.time()
+        index.record(['old'] * 3, at=now - 3 * 3600)  # 3 uses, three half-lives ago
+        index.record(['new'], at=now)
+        index._take_snapshot(now)
+        self.assertEqual([entry['name'] for entry in index.top(10)], ['new', 'old'])
+        self.assertAlmostEqual(index.top(10)[1]['score'], 0.375, places=2)
+
+    def test_resync_replays_recent_public_posts(self):
+        user = User.objects.create_user(username='dj', password='password123')
+        for caption, is_public in (('one', True), ('two', True), ('hidden', False)):
+            post = Post.objects.create(owner=user, caption=caption, is_public=is_public)
+            attach_tags(post, resolve_tags(['techno'] if caption != 'two' else ['techno', 'house']))
+        index = TrendingIndex(half_life=3600, window=86400, snapshot_interval=5, resync_interval=3600, size=10)
+        self.assertEqual([(entry['name'], round(entry['score'])) for entry in index.top(10)], [('techno', 2), ('house', 1)])
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        index = TrendingIndex(half_life=3600, window=86400, snapshot_interval=0, resync_interval=60, size=10)
+        index.record(['techno'])
+        index._synced_at = time.time() - 120
+        index._take_snapshot(time.time())
+
+        with patch('noctra_app.trending.enqueue') as enqueue, self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(index.top(5)[0]['name'], 'techno')
+        # One rebuild for all the readers that found the index stale
+        enqueue.assert_called_once_with(index._background_resync)
+
+
+class SearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='raver', password='password123')
+        cls.club = Club.objects.create(
+            name='Baum', main_location='Bogotá', contact_number='0', description='Techno club', created_by=cls.user,
+        )
+        ClubProfile.objects.create(club=cls.club, address='Calle 33 Chapinero')
+        cls.event = Event.objects.create(
+            club=cls.club, name='Closing party', date=timezone.now(), ticket_price=10, total_tickets=5, available_tickets=5,
+        )
+        Post.objects.create(owner=cls.user, caption='Best techno night at Baum')
+        Post.objects.create(owner=cls.user, caption='Secret techno afterparty', is_public=False)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def results(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['id']) for result in response.data['results']]
+
+    def test_prefix_and_ranking(self):
+        # The title (club name) outranks a mention in a caption
+        self.assertEqual(self.results(q='bau')[0], ('club', str(self.club.pk)))
+        self.assertEqual(self.results(q='chapi'), [('club', str(self.club.pk))])
+        self.assertEqual(self.results(q='bogota'), [('club', str(self.club.pk))])  # diacritics are folded
+        self.assertEqual(self.results(q='techno', type='post'), [('post', str(Post.objects.get(is_public=True).pk))])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.event.name = 'Opening party'
+        self.event.save()
+        self.assertEqual(self.results(q='opening'), [('event', str(self.event.pk))])
+        self.assertEqual(self.results(q='closing'), [])
+        self.event.delete()
+        self.assertEqual(self.results(q='opening'), [])
+
+    def test_pagination(self):
+        response = self.client.get('/api/search/', {'q': 'baum', 'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIn('offset=1', response.data['next'])
+
+
+class AutocompleteTests(APITestCase):
+    def test_prefix_lookup_ranked_by_followers(self):
+        index = PrefixIndex(resync_interval=3600, scan_limit=100)
+        ana, anabel, andres = (User.objects.create_user(username=name).profile for name in ('ana', 'Anabel', 'andrés'))
+        Club.objects.create(name='Andromeda', main_location='x', contact_number='0', created_by=ana.user)
+        for follower in ('f1', 'f2'):
+            Follow.objects.create(follower=User.objects.create_user(username=follower).profile, following_user=anabel)
+        index.resync()
+
+        self.assertEqual([hit['name'] for hit in index.lookup('an')], ['Anabel', 'ana', 'andrés', 'Andromeda'])
+        self.assertEqual([hit['name'] for hit in index.lookup('@andre', kinds=('user',))], ['andrés'])
+
+        # Incremental updates: renames move the entry, deletes drop it
+        index.put('user', ana.id, 'zoe')
+        index.remove('user', andres.id)
+        index.adjust_followers('user', ana.id, 5)
+        self.assertEqual([hit['name'] for hit in index.lookup('an')], ['Anabel', 'Andromeda'])
+        self.assertEqual(index.lookup('zo'), [{'type': 'user', 'id': ana.id, 'name': 'zoe'}])
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        index = PrefixIndex(resync_interval=60, scan_limit=100)
+        User.objects.create_user(username='ana')
+        with patch('noctra_app.autocomplete.enqueue') as enqueue:
+            index.warm()
+            enqueue.assert_called_once_with(index._background_resync)
+            index._background_resync()
+
+            index._synced_at = time.time() - 120
+            with self.assertNumQueries(0):
+                for _ in range(3):
+                    self.assertEqual(index.lookup('an')[0]['name'], 'ana')
+        # One rebuild for all the lookups that found the index stale
+        self.assertEqual(enqueue.call_count, 2)
+
+    def test_busy_prefix_ranked_beyond_the_scan(self):
+        index = PrefixIndex(resync_interval=3600, scan_limit=2, top_size=2)
+        profiles = {name: User.objects.create_user(username=name).profile for name in ('maa', 'mab', 'mac', 'mzz')}
+        Follow.objects.create(follower=profiles['maa'], following_user=profiles['mzz'])
+        index.resync()
+
+        # "m" matches more names than a lookup scans, the most followed one sorts last
+        self.assertEqual(index.lookup('m')[0]['name'], 'mzz')
+        self.assertCountEqual([hit['name'] for hit in index.lookup('ma')], ['maa', 'mab'])
+
+        index.adjust_followers('user', profiles['mac'].id, 3)
+        index.remove('user', profiles['mzz'].id)
+        index.put('user', profiles['maa'].id, 'mya')
+        # Updates between resyncs are offered to the busy prefixes of the new name
+        self.assertEqual([hit['name'] for hit in index.lookup('m')], ['mac', 'mya'])
+        self.assertEqual([hit['name'] for hit in index.lookup('ma')], ['mac', 'mab'])
+
+
+class CommentTreeTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='talker', password='password123')
+        cls.post = Post.objects.create(owner=cls.user, caption='Thread')
+        cls.roots = [Comment.objects.create(post=cls.post, author=cls.user, text=f'root {i}') for i in range(3)]
+        # A deep chain under the first root, plus a second reply to it
+        parent = cls.roots[0]
+        for depth in range(1, 6):
+            parent = Comment.objects.create(post=cls.post, author=cls.user, text=f'level {depth}', parent=parent)
+        Comment.objects.create(post=cls.post, author=cls.user, text='sibling', parent=cls.roots[0])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_whole_tree_in_flat_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/comments/tree/{self.post.id}/')
+        # post exists check + the tree
+        self.assertEqual(len(ctx.captured_queries), 2)
+        first = response.data[0]
+        self.assertEqual([root['text'] for root in response.data], ['root 0', 'root 1', 'root 2'])
+        self.assertEqual(first['reply_count'], 6)
+        self.assertEqual([reply['text'] for reply in first['replies']], ['level 1', 'sibling'])
+        node, depth = first, 0
+        while node['replies']:
+            node, depth = node['replies'][0], depth + 1
+        self.assertEqual((node['text'], node['depth'], depth), ('level 5', 5, 5))
+
+    def test_root_and_reply_limits(self):
+        response = self.client.get(f'/api/comments/tree/{self.post.id}/', {'roots': 2, 'replies': 2})
+        self.assertEqual([root['text'] for root in response.data], ['root 0', 'root 1'])
+        self.assertEqual(response.data[0]['reply_count'], 6)
+        self.assertEqual(response.data[0]['replies'][0]['text'], 'level 1')
+        self.assertEqual(response.data[0]['replies'][0]['replies'][0]['text'], 'level 2')
+        self.assertEqual(response.data[0]['replies'][0]['replies'][0]['replies'], [])
+
+
+class FollowGraphTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user(username='me', password='password123').profile
+        cls.others = [User.objects.create_user(username=f'other{i}').profile for i in range(4)]
+        cls.club = Club.objects.create(name='Club', main_location='x', contact_number='0', created_by=cls.me.user)
+        cls.club_profile = ClubProfile.objects.create(club=cls.club)
+
+    def setUp(self):
+        self.client.force_authenticate(self.me.user)
+
+    def test_counters_and_uniqueness(self):
+        Follow.objects.create(follower=self.me, following_club=self.club_profile)
+        response = self.client.post('/api/follows/', {'follower': self.me.id, 'following_user': self.others[0].id})
+        self.assertEqual(response.status_code, 201)
+        # Following twice is refused
+        response = self.client.post('/api/follows/', {'follower': self.me.id, 'following_user': self.others[0].id})
+        self.assertEqual(response.status_code, 400)
+
+        self.me.refresh_from_db()
+        self.others[0].refresh_from_db()
+        self.club_profile.refresh_from_db()
+        self.assertEqual((self.me.following_count, self.others[0].followers_count, self.club_profile.followers_count), (2, 1, 1))
+
+        Follow.objects.get(follower=self.me, following_user=self.others[0]).delete()
+        self.others[0].refresh_from_db()
+        self.assertEqual(self.others[0].followers_count, 0)
+
+    def test_batched_check_uses_the_adjacency_cache_for_hot_accounts(self):
+        Follow.objects.create(follower=self.me, following_user=self.others[1])
+        Follow.objects.create(follower=self.me, following_club=self.club_profile)
+        hot = self.others[2]
+        for other in self.others[:2]:
+            Follow.objects.create(follower=other, following_user=hot)
+
+        cache = AdjacencyCache(threshold=2, size=10, ttl=60)
+        with patch('noctra_app.follow_graph.adjacency', cache), patch('noctra_app.signals.adjacency', cache):
+            ids = ','.join(str(profile.id) for profile in self.others)
+            response = self.client.get('/api/follows/check/', {'users': ids, 'clubs': self.club_profile.id})
+            self.assertEqual(response.data['users'], {
+                str(self.others[0].id): False, str(self.others[1].id): True,
+                str(hot.id): False, str(self.others[3].id): False,
+            })
+            self.assertEqual(response.data['clubs'], {str(self.club_profile.id): True})
+            self.assertIn(('user', hot.id), cache._followers)
+
+            # Following the hot account updates the cached array in place
+            Follow.objects.create(follower=self.me, following_user=hot)
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertTrue(is_following(self.me.id, [('user', hot.id)])[('user', hot.id)])
+            self.assertEqual(len(ctx.captured_queries), 0)
+
+
+class RecommendationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.me, cls.friend, cls.fof, cls.raver, cls.stranger = (
+            User.objects.create_user(username=name).profile for name in ('me', 'friend', 'fof', 'raver', 'stranger')
+        )
+        cls.club = Club.objects.create(name='Club', main_location='x', contact_number='0', created_by=cls.me.user)
+        cls.club_profile = ClubProfile.objects.create(club=cls.club)
+        event = Event.objects.create(
+            club=cls.club, name='Night', date=timezone.now(), ticket_price=10, total_tickets=10, available_tickets=10,
+        )
+        Follow.objects.create(follower=cls.me, following_user=cls.friend)
+        Follow.objects.create(follower=cls.friend, following_user=cls.fof)
+        Follow.objects.create(follower=cls.friend, following_club=cls.club_profile)
+        for profile in (cls.me, cls.raver):
+            purchase_tickets(profile.user, event)
+
+    def test_build_and_serve(self):
+        profiles, written = build_recommendations(processes=2, shard_size=2)
+        self.assertEqual(profiles, 5)
+        self.assertGreater(written, 0)
+
+        self.client.force_authenticate(self.me.user)
+        people = self.client.get('/api/recommendations/').data
+        self.assertEqual({person['name'] for person in people}, {'fof', 'raver'})
+        self.assertNotIn('stranger', [person['name'] for person in people])
+        clubs = self.client.get('/api/recommendations/', {'type': 'club'}).data
+        self.assertEqual(clubs[0]['id'], self.club_profile.id)
+        self.assertEqual(clubs[0]['reasons'], {'friends': 1, 'visits': 1})
+
+        # Following a suggestion hides it without waiting for the next build
+        Follow.objects.create(follower=self.me, following_user=self.fof)
+        people = self.client.get('/api/recommendations/').data
+        self.assertEqual([person['name'] for person in people], ['raver'])
+
+
+class NotificationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='password123')
+        cls.fans = [User.objects.create_user(username=f'fan{i}') for i in range(4)]
+        cls.post = Post.objects.create(owner=cls.owner, caption='Tonight')
+
+    def setUp(self):
+        patcher = patch.object(notifier, '_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(self.owner)
+
+    def like(self, *users):
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in users:
+                Like.objects.create(post=self.post, user=user)
+        notifier.flush()
+
+    def unread(self):
+        return self.client.get('/api/notifications/unread-count/').data['unread']
+
+    def test_events_are_merged(self):
+        self.like(self.owner, *self.fans[:3])
+        notifications = self.client.get('/api/notifications/').data['results']
+        self.assertEqual(len(notifications), 1)
+        self.assertEqual(notifications[0]['message'], '3 people liked your post')
+        self.assertEqual(self.unread(), 1)
+
+        # Later likes update the unread row instead of adding one
+        self.like(self.fans[3])
+        notification = Notification.objects.get(user=self.owner)
+        self.assertEqual((notification.actor_count, notification.actors[0]), (4, self.fans[3].id))
+        self.assertEqual(self.unread(), 1)
+
+    def test_mark_all_read(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.fans[0], text='!')
+            Follow.objects.create(follower=self.fans[0].profile, following_user=self.owner.profile)
+        notifier.flush()
+        self.assertEqual(self.unread(), 2)
+
+        response = self.client.post('/api/notifications/read-all/')
+        self.assertEqual((response.data['updated'], self.unread()), (2, 0))
+
+        # A read notification is not merged into, the next like starts a new one
+        self.like(self.fans[1])
+        self.assertEqual(self.client.get('/api/notifications/', {'unread': 'true'}).data['results'][0]['message'],
+                         'fan1 liked your post')
+        self.assertEqual(self.unread(), 1)
+
+    def test_reservation_status_change(self):
+        club = Club.objects.create(name='Club', main_location='x', contact_number='0', created_by=self.owner)
+        event = Event.objects.create(
+            club=club, name='Night', date=timezone.now(), ticket_price=10, total_tickets=10, available_tickets=10,
+        )
+        reservation = Reservation.objects.create(user=self.fans[0], club=club, event=event, table_number=1, group_size=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.status = 'approved'
+            reservation.save()
+        notifier.flush()
+        self.assertEqual(
+            list(Notification.objects.filter(user=self.fans[0]).values_list('message', flat=True)),
+            ['Your reservation for Night was approved'],
+        )
+
+
+class RealtimeTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='listener', password='password123')
+        cls.fan = User.objects.create_user(username='fan')
+        cls.token = Token.objects.create(user=cls.user)
+        club = Club.objects.create(name='Club', main_location='x', contact_number='0', created_by=cls.user)
+        cls.event = Event.objects.create(
+            club=club, name='Night', date=timezone.now(), ticket_price=10, total_tickets=10, available_tickets=10,
+        )
+
+    def setUp(self):
+        for buffer in (notifier, availability_publisher):
+            patcher = patch.object(buffer, '_flusher')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def connect(self, query, then):
+        """
+        Opens a WebSocket on the ASGI app, runs then() once it is accepted and returns
+        the close code (None if accepted) and the messages pushed until then() returned.
+        """
+        async def session():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            await inbox.put({'type': 'websocket.connect'})
+            scope = {'type': 'websocket', 'path': '/ws/', 'query_string': query.encode(), 'headers': []}
+            connection = asyncio.ensure_future(websocket_application(scope, inbox.get, outbox.put))
+            first = await asyncio.wait_for(outbox.get(), 5)
+            if first['type'] == 'websocket.close':
+                return first['code'], []
+            await sync_to_async(then)()
+            await asyncio.sleep(0.05)
+            await inbox.put({'type': 'websocket.disconnect'})
+            await asyncio.wait_for(connection, 5)
+            return None, [json.loads(outbox.get_nowait()['text']) for _ in range(outbox.qsize())]
+
+        return async_to_sync(session)()
+
+    def test_rejects_unknown_token(self):
+        code, _ = self.connect('token=nope', lambda: None)
+        self.assertEqual(code, 4401)
+
+    def test_pushes_notifications_and_ticket_counts(self):
+        post = Post.objects.create(owner=self.user, caption='Tonight')
+
+        def activity():
+            with self.captureOnCommitCallbacks(execute=True):
+                Like.objects.create(post=post, user=self.fan)
+                purchase_tickets(self.fan, self.event, 2)
+            notifier.flush()
+            availability_publisher.flush()
+
+        code, messages = self.connect(f'token={self.token.key}&events={self.event.pk}', activity)
+        self.assertIsNone(code)
+        by_type = {message['type']: message for message in messages}
+        self.assertEqual(by_type['notification']['notification']['message'], 'fan liked your post')
+        self.assertEqual(by_type['tickets']['available_tickets'], 8)
@@ -0,0 +1,244 @@
+import random
+import secrets
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Event, EventInventoryShard, Ticket
+from .pubsub import publish
+from .tasks import PeriodicFlusher
+
+
+class SoldOut(Exception):
+    pass
+
+
+def generate_qr_code():
+    return secrets.token_urlsafe(24)
+
+
+def purchase_tickets(user, event, quantity=1):
+    """
+    Takes `quantity` tickets with conditional UPDATEs, so concurrent buyers can never
+    push the inventory below zero and nobody has to lock and retry. Raises SoldOut otherwise.
+    """
+    with transaction.atomic():
+        _take_tickets(event, quantity)
+
+        valid_until = event.date + timedelta(hours=settings.TICKET_VALID_HOURS)
+        tickets = [
+            Ticket(
+                user=user, event=event, club_id=event.club_id, qr_code=generate_qr_code(),
+                price_paid=event.ticket_price, valid_until=valid_until,
+            )
+            for _ in range(quantity)
+        ]
+        Ticket.objects.bulk_create(tickets)
+        transaction.on_commit(lambda: availability_publisher.touch(event.pk))
+    return tickets
+
+
+def _take_tickets(event, quantity):
+    # `event` may be stale: the UPDATEs only match the layout the event has right now, and a
+    # miss re-reads shard_count in case set_inventory_shards switched it since it was loaded
+    for _ in range(2):
+        if event.shard_count:
+            try:
+                _take_from_shards(event, quantity)
+                return
+            except SoldOut:
+                pass
+        elif Event.objects.filter(pk=event.pk, shard_count=0, available_tickets__gte=quantity).update(
+            available_tickets=F('available_tickets') - quantity
+        ):
+            return
+        shard_count = Event.objects.filter(pk=event.pk).values_list('shard_count', flat=True).first()
+        if shard_count is None or shard_count == event.shard_count:
+            break
+        event.shard_count = shard_count
+    raise SoldOut()
+
+
+# Sharded inventory
+
+def _take(event, index, quantity):
+    return EventInventoryShard.objects.filter(event=event, index=index, available__gte=quantity).update(
+        available=F('available') - quantity
+    )
+
+
+def _take_from_shards(event, quantity):
+    # Fast path: one random bucket, no read needed
+    if _take(event, random.randrange(event.shard_count), quantity):
+        return
+
+    shards = list(
+        EventInventoryShard.objects.filter(event=event, available__gt=0).values_list('index', 'available')
+    )
+    random.shuffle(shards)
+
+    # Then any bucket that can cover the whole order
+    for index, available in shards:
+        if available >= quantity and _take(event, index, quantity):
+            return
+
+    # Fragmented leftovers: gather the order from several buckets, rolled back if it still falls short
+    remaining = quantity
+    for index, available in shards:
+        portion = min(available, remaining)
+        if _take(event, index, portion):
+            remaining -= portion
+            if not remaining:
+                return
+    raise SoldOut()
+
+
+def _available_cache_key(event):
+    return f'event:{event.pk}:available_tickets'
+
+
+def refresh_available_tickets(event):
+    # Sum the buckets and write the total back to Event.available_tickets
+    available = EventInventoryShard.objects.filter(event=event).aggregate(total=Sum('available'))['total'] or 0
+    Event.objects.filter(pk=event.pk).update(available_tickets=available)
+    cache.set(_available_cache_key(event), available, settings.TICKET_SHARD_REFRESH_SECONDS)
+    return available
+
+
+def get_available_tickets(event):
+    # Sharded events report a cached aggregate that is at most TICKET_SHARD_REFRESH_SECONDS old
+    if not event.shard_count:
+        return event.available_tickets
+    available = cache.get(_available_cache_key(event))
+    if available is None:
+        available = refresh_available_tickets(event)
+    return available
+
+
+def set_inventory_shards(event, shard_count):
+    """
+    Switches an event between the single counter (shard_count=0) and N buckets.
+    The remaining tickets are moved over as-is, so the buckets never add up to more than total_tickets.
+    """
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(pk=event.pk)
+
+        available = event.available_tickets
+        if event.shard_count:
+            shards = EventInventoryShard.objects.filter(event=event)
+            # Locked, so a purchase cannot take from a bucket after it has been counted
+            available = sum(shards.select_for_update().values_list('available', flat=True))
+            shards.delete()
+
+        if shard_count:
+            per_shard, extra = divmod(available, shard_count)
+            EventInventoryShard.objects.bulk_create([
+                EventInventoryShard(event=event, index=index, available=per_shard + (1 if index < extra else 0))
+                for index in range(shard_count)
+            ])
+
+        Event.objects.filter(pk=event.pk).update(shard_count=shard_count, available_tickets=available)
+
+    cache.delete(_available_cache_key(event))
+    event.shard_count = shard_count
+    event.available_tickets = available
+    return event
+
+
+# Live ticket counts
+
+class AvailabilityPublisher:
+    """
+    Pushes Event.available_tickets to the clients following an event, see realtime.py.
+    Sales only mark the event; every `interval` seconds each marked event is read once and
+    published once, so a rush of purchases costs one push per interval, not one per sale.
+    """
+
+    def __init__(self, interval):
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._flusher = PeriodicFlusher(self.flush, interval, 'ticket-counts')
+
+    def touch(self, event_id):
+        self._flusher.start()
+        with self._lock:
+            self._changed.add(event_id)
+
+    def flush(self):
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        for event in Event.objects.filter(pk__in=changed).only('id', 'shard_count', 'available_tickets'):
+            publish(f'event:{event.pk}', {
+                'type': 'tickets', 'event': event.pk, 'available_tickets': get_available_tickets(event),
+            })
+        return len(changed)
+
+
+availability_publisher = AvailabilityPublisher(settings.REALTIME_TICKETS_INTERVAL)
+
+
+# Door check-in
+
+def check_in_tickets(codes, club_id, event_id=None):
+    """
+    Validates a burst of scanned QR codes with one locked lookup on the qr_code index and
+    admits the valid ones with one UPDATE. Returns a result per scanned code, in scan order.
+    """
+    now = timezone.now()
+    unique_codes = list(dict.fromkeys(codes))
+
+    with transaction.atomic():
+        tickets = {
+            ticket['qr_code']: ticket
+            for ticket in Ticket.objects.select_for_update()
+            .filter(qr_code__in=unique_codes)
+            .values('id', 'qr_code', 'club_id', 'event_id', 'valid_until', 'used_at')
+        }
+
+        statuses = {}
+        admitted = []
+        for code in unique_codes:
+            ticket = tickets.get(code)
+            if ticket is None:
+                statuses[code] = 'not_found'
+            elif str(ticket['club_id']) != str(club_id):
+                statuses[code] = 'wrong_club'
+            elif event_id and str(ticket['event_id']) != str(event_id):
+                statuses[code] = 'wrong_event'
+            elif ticket['used_at']:
+                statuses[code] = 'already_used'
+            elif ticket['valid_until'] < now:
+                statuses[code] = 'expired'
+            else:
+                statuses[code] = 'admitted'
+                admitted.append(ticket['id'])
+
+        if admitted:
+            updated = Ticket.objects.filter(id__in=admitted, used_at__isnull=True).update(used_at=now)
+            if updated != len(admitted):
+                # Lost a race to another scanner (no row locks on SQLite): keep only the rows we stamped
+                stamped = set(Ticket.objects.filter(id__in=admitted, used_at=now).values_list('id', flat=True))
+                lost = set(admitted) - stamped
+                for ticket in tickets.values():
+                    if ticket['id'] in lost:
+                        statuses[ticket['qr_code']] = 'already_used'
+
+    results = []
+    seen = set()
+    for code in codes:
+        ticket = tickets.get(code)
+        # The same code twice in one burst is a second entry attempt
+        result_status = 'already_used' if code in seen and ticket else statuses[code]
+        seen.add(code)
+        results.append({
+            'code': code,
+            'status': result_status,
+            'ticket': ticket['id'] if ticket else None,
+            'used_at': now if statuses[code] == 'admitted' else (ticket['used_at'] if ticket else None),
+        })
+    return results
@@ -0,0 +1,99 @@
+import heapq
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserProfile
+from .pagination import decode_cursor, encode_cursor, keyset_before
+from .pubsub import publish_many
+
+
+def fanout_limit():
+    # Accounts with more followers than this are merged in at read time instead
+    return getattr(settings, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 1000)
+
+
+def fan_out_post(post):
+    # Fan-out-on-write: copy the post id into the owner's feed and every follower's feed
+    profile = UserProfile.objects.filter(user_id=post.owner_id).only('id', 'feed_id', 'followers_count').first()
+    if profile is None:
+        return
+
+    feed_ids = [profile.feed_id] if profile.feed_id else []
+    follower_user_ids = []
+
+    # Celebrities skip the follower writes, their posts are pulled by read_timeline
+    if profile.followers_count <= fanout_limit():
+        for feed_id, user_id in Follow.objects.filter(following_user=profile, follower__feed__isnull=False).values_list(
+            'follower__feed_id', 'follower__user_id'
+        ):
+            feed_ids.append(feed_id)
+            follower_user_ids.append(user_id)
+
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(feed_id=feed_id, post_id=post.id, created_at=post.created_at) for feed_id in set(feed_ids)],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+    # Followers online right now hear about the new entry, see realtime.py
+    entry = {'type': 'timeline', 'post': post.id, 'owner': post.owner_id, 'created_at': post.created_at}
+    channels = [f'user:{user_id}' for user_id in follower_user_ids]
+    transaction.on_commit(lambda: publish_many(channels, entry))
+
+
+def pull_owner_ids(profile):
+    """
+    Fan-out-on-read sources as (followed celebrities, creators of followed clubs).
+    Following a club is not following its creator, so only their public posts are pulled.
+    """
+    celebrities = (
+        Follow.objects.filter(follower=profile, following_user__followers_count__gt=fanout_limit())
+        .values_list('following_user__user_id', flat=True)
+    )
+    clubs = (
+        Follow.objects.filter(follower=profile, following_club__club__created_by__isnull=False)
+        .values_list('following_club__club__created_by_id', flat=True)
+    )
+    return set(celebrities), set(clubs)
+
+
+def read_timeline(feed, cursor=None, page_size=20):
+    """
+    Returns (posts, next_cursor) for a feed, newest first, keyed on (created_at, post id).
+    Materialized entries and pulled posts are merged so both paginate together.
+    """
+    position = decode_cursor(cursor) if cursor else None
+
+    entries = TimelineEntry.objects.filter(feed=feed)
+    if position:
+        entries = entries.filter(keyset_before(position, 'created_at', 'post_id'))
+    pushed = list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:page_size + 1])
+
+    pulled = []
+    profile = UserProfile.objects.filter(feed=feed).only('id').first()
+    followed_owners, club_owners = pull_owner_ids(profile) if profile else (set(), set())
+    if followed_owners or club_owners:
+        posts = Post.objects.filter(Q(owner_id__in=followed_owners) | Q(owner_id__in=club_owners, is_public=True))
+        if position:
+            posts = posts.filter(keyset_before(position))
+        pulled = list(posts.order_by('-created_at', '-id').values_list('created_at', 'id')[:page_size + 1])
+
+    rows = []
+    seen = set()
+    for created_at, post_id in heapq.merge(pushed, pulled, reverse=True):
+        if post_id in seen:
+            continue
+        seen.add(post_id)
+        rows.append((created_at, post_id))
+        if len(rows) > page_size:
+            break
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*rows[-1])
+
+    posts_by_id = Post.objects.for_serializer().in_bulk([post_id for _, post_id in rows])
+    return [posts_by_id[post_id] for _, post_id in rows if post_id in posts_by_id], next_cursor
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import uuid
+
+from django.conf import settings
+
+from .models import PostMedia
+from .tasks import enqueue
+
+logger = logging.getLogger(__name__)
+
+
+# Output lives next to the source blob, so every upload of the same video shares one set of renditions
+# and storage.release() removes it with the blob:
+#   blobs/aa/bb/<digest>_hls/master.m3u8, <digest>_hls/stream_<n>.m3u8 + stream_<n>_000.ts ...
+#   blobs/aa/bb/<digest>_poster.jpg
+
+def output_names(source_name):
+    stem = os.path.splitext(source_name)[0]
+    return f'{stem}_hls/master.m3u8', f'{stem}_poster.jpg'
+
+
+def transcode_threads():
+    # Each job gets its share of the cores, so a full queue never oversubscribes the machine
+    workers = settings.BACKGROUND_QUEUE_WORKERS.get('transcode', 1)
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def probe(path):
+    """
+    Returns (height, has_audio) of a video file.
+    """
+    output = subprocess.run(
+        [settings.FFPROBE_BINARY, '-v', 'error', '-show_entries', 'stream=codec_type,height', '-of', 'json', path],
+        capture_output=True, check=True, timeout=60,
+    ).stdout
+    streams = json.loads(output).get('streams', [])
+    heights = [stream.get('height') or 0 for stream in streams if stream.get('codec_type') == 'video']
+    if not heights:
+        raise ValueError('No video stream')
+    return max(heights), any(stream.get('codec_type') == 'audio' for stream in streams)
+
+
+def rendition_ladder(source_height):
+    ladder = [rung for rung in settings.VIDEO_HLS_RENDITIONS if rung[0] <= source_height]
+    # Sources below the smallest rung still get one rendition at their own height
+    return ladder or [(source_height - source_height % 2, *settings.VIDEO_HLS_RENDITIONS[0][1:])]
+
+
+def hls_command(source, output_dir, renditions, has_audio, threads):
+    """
+    One ffmpeg run that decodes the source once and encodes every rendition from it,
+    writing the variant playlists and master.m3u8 into output_dir.
+    """
+    count = len(renditions)
+    scales = ';'.join(f'[v{index}]scale=-2:{height}[v{index}out]' for index, (height, _, _) in enumerate(renditions))
+    filters = f"[0:v]split={count}{''.join(f'[v{index}]' for index in range(count))};{scales}"
+
+    command = [
+        settings.FFMPEG_BINARY, '-y', '-v', 'error', '-i', source, '-filter_complex', filters,
+        '-threads', str(threads), '-preset', 'veryfast', '-g', '48', '-keyint_min', '48', '-sc_threshold', '0',
+    ]
+    for index, (height, video_bitrate, audio_bitrate) in enumerate(renditions):
+        command += [
+            '-map', f'[v{index}out]', f'-c:v:{index}', 'libx264', f'-b:v:{index}', video_bitrate,
+            f'-maxrate:v:{index}', video_bitrate, f'-bufsize:v:{index}', video_bitrate,
+        ]
+        if has_audio:
+            command += ['-map', '0:a:0', f'-c:a:{index}', 'aac', f'-b:a:{index}', audio_bitrate, '-ac', '2']
+
+    stream_map = ' '.join(f'v:{index},a:{index}' if has_audio else f'v:{index}' for index in range(count))
+    command += [
+        '-f', 'hls', '-hls_time', str(settings.VIDEO_HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_flags', 'independent_segments', '-master_pl_name', 'master.m3u8',
+        '-hls_segment_filename', os.path.join(output_dir, 'stream_%v_%03d.ts'),
+        '-var_stream_map', stream_map, os.path.join(output_dir, 'stream_%v.m3u8'),
+    ]
+    return command
+
+
+def poster_command(source, poster_path, offset):
+    return [
+        settings.FFMPEG_BINARY, '-y', '-v', 'error', '-ss', str(offset), '-i', source,
+        '-frames:v', '1', '-vf', 'scale=-2:720', '-q:v', '3', poster_path,
+    ]
+
+
+def _ffmpeg(command):
+    subprocess.run(command, capture_output=True, check=True, timeout=settings.VIDEO_TRANSCODE_TIMEOUT)
+
+
+def _package(source, output_dir):
+    height, has_audio = probe(source)
+    # Written to a scratch directory and renamed into place, so a playlist is never served half written
+    scratch = f'{output_dir}.{uuid.uuid4().hex}.tmp'
+    os.makedirs(scratch)
+    try:
+        _ffmpeg(hls_command(source, scratch, rendition_ladder(height), has_audio, transcode_threads()))
+        try:
+            os.rename(scratch, output_dir)
+        except OSError:
+            # Another job packaged the same blob first
+            if not os.path.isdir(output_dir):
+                raise
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _grab_poster(source, poster_path):
+    # One second in skips the black lead-in frame, very short clips fall back to the first frame
+    for offset in (1, 0):
+        _ffmpeg(poster_command(source, poster_path, offset))
+        if os.path.isfile(poster_path):
+            return
+
+
+def transcode_video(media_id):
+    # Claiming the row with a conditional UPDATE keeps a job from running twice
+    if not PostMedia.objects.filter(pk=media_id, transcode_status='pending').update(transcode_status='processing'):
+        return
+    name = PostMedia.objects.filter(pk=media_id).values_list('file', flat=True).first()
+    source = os.path.join(settings.MEDIA_ROOT, name)
+    manifest_name, poster_name = output_names(name)
+    output_dir = os.path.dirname(os.path.join(settings.MEDIA_ROOT, manifest_name))
+    poster_path = os.path.join(settings.MEDIA_ROOT, poster_name)
+
+    try:
+        if not os.path.isfile(os.path.join(settings.MEDIA_ROOT, manifest_name)):
+            _package(source, output_dir)
+        if not os.path.isfile(poster_path):
+            _grab_poster(source, poster_path)
+    except (OSError, ValueError, subprocess.SubprocessError) as error:
+        stderr = getattr(error, 'stderr', None) or b''
+        logger.error("Transcoding media %s failed: %s %s", media_id, error, stderr.decode(errors='replace')[-2000:])
+        PostMedia.objects.filter(pk=media_id, file=name).update(transcode_status='failed')
+        return
+
+    # Matching on the file name skips stale results if the file was swapped in the meantime
+    PostMedia.objects.filter(pk=media_id, file=name).update(
+        transcode_status='ready', hls_manifest=manifest_name,
+        poster=poster_name if os.path.isfile(poster_path) else '',
+    )
+
+
+def schedule_transcode(media):
+    if not shutil.which(settings.FFMPEG_BINARY) or not shutil.which(settings.FFPROBE_BINARY):
+        logger.warning("ffmpeg/ffprobe not found, media %s is served without HLS renditions", media.pk)
+        PostMedia.objects.filter(pk=media.pk).update(transcode_status='failed')
+        return
+    PostMedia.objects.filter(pk=media.pk).update(transcode_status='pending', hls_manifest='', poster='')
+    enqueue(transcode_video, media.pk, queue='transcode')
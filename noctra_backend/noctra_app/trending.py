@@ -0,0 +1,122 @@
+import heapq
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Post
+from .tasks import enqueue
+
+
+class TrendingIndex:
+    """
+    Exponentially decayed usage counters per hashtag, kept in memory.
+    Each use adds 1 and the sum halves every `half_life` seconds, so a score only has to be
+    decayed when it changes or when a snapshot is taken. Readers get the last top-K snapshot,
+    rebuilt at most every `snapshot_interval` seconds.
+
+    Every process counts its own posts, so the index is periodically rebuilt from the posts
+    of the last `window` seconds to pick up what the other workers saw. The rebuild runs on the
+    worker queue, one at a time, while readers keep getting the current snapshot; only the very
+    first read of a process waits for it.
+    """
+
+    def __init__(self, half_life, window, snapshot_interval, resync_interval, size):
+        self.decay_rate = math.log(2) / half_life
+        self.window = window
+        self.snapshot_interval = snapshot_interval
+        self.resync_interval = resync_interval
+        self.size = size
+        self._lock = threading.Lock()
+        self._scores = {}  # tag name -> (score, unix time it was computed at)
+        self._snapshot = []
+        self._snapshot_at = None
+        self._synced_at = None
+        self._resync_lock = threading.Lock()
+        self._resync_queued = False
+
+    def _decayed(self, score, since, now):
+        return score * math.exp(-self.decay_rate * (now - since))
+
+    def record(self, names, at=None):
+        at = at or time.time()
+        with self._lock:
+            for name in names:
+                score, since = self._scores.get(name, (0.0, at))
+                self._scores[name] = (self._decayed(score, since, at) + 1.0, at)
+
+    def top(self, limit):
+        now = time.time()
+        if self._synced_at is None:
+            self.resync(now, only_if_cold=True)
+        else:
+            if now - self._synced_at >= self.resync_interval:
+                self._queue_resync()
+            if now - self._snapshot_at >= self.snapshot_interval:
+                self._take_snapshot(now)
+        return self._snapshot[:limit]
+
+    def _queue_resync(self):
+        with self._lock:
+            if self._resync_queued:
+                return
+            self._resync_queued = True
+        enqueue(self._background_resync)
+
+    def _background_resync(self):
+        try:
+            self.resync()
+        finally:
+            self._resync_queued = False
+
+    def _take_snapshot(self, now):
+        with self._lock:
+            scores = [(self._decayed(score, since, now), name) for name, (score, since) in self._scores.items()]
+            # Anything that decayed to less than a hundredth of a post is dropped for good
+            self._scores = {
+                name: (score, now) for score, name in scores if score >= 0.01
+            }
+            self._snapshot = [
+                {'name': name, 'score': round(score, 3)} for score, name in heapq.nlargest(self.size, scores)
+                if score >= 0.01
+            ]
+            self._snapshot_at = now
+
+    def resync(self, now=None, only_if_cold=False):
+        # Replays the hashtags of recent public posts, one query over the post/tag through table
+        with self._resync_lock:
+            if only_if_cold and self._synced_at is not None:
+                return  # another thread loaded it while this one waited
+            self._load(now or time.time())
+
+    def _load(self, now):
+        since = timezone.now() - timedelta(seconds=self.window)
+        uses = Post.tags.through.objects.filter(
+            post__created_at__gte=since, post__is_public=True,
+        ).values_list('tag__name', 'post__created_at')
+
+        scores = {}
+        for name, created_at in uses.iterator():
+            scores[name] = scores.get(name, 0.0) + self._decayed(1.0, created_at.timestamp(), now)
+        with self._lock:
+            self._scores = {name: (score, now) for name, score in scores.items()}
+            self._synced_at = now
+        self._take_snapshot(now)
+
+
+trending_tags = TrendingIndex(
+    half_life=settings.TRENDING_HALF_LIFE,
+    window=settings.TRENDING_WINDOW,
+    snapshot_interval=settings.TRENDING_SNAPSHOT_SECONDS,
+    resync_interval=settings.TRENDING_RESYNC_SECONDS,
+    size=settings.TRENDING_MAX_RESULTS,
+)
+
+
+def record_post_tags(post):
+    # Usage event for a new post, private posts do not count towards trending
+    if post.is_public:
+        trending_tags.record(post.tags.values_list('name', flat=True))
@@ -0,0 +1,70 @@
+import logging
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .media_pipeline import process_post_media
+from .models import MediaUpload, PostMedia
+
+logger = logging.getLogger(__name__)
+
+
+class OffsetMismatch(Exception):
+    pass
+
+
+def start_upload(upload):
+    # Reserve an empty partial file that the chunks are written into
+    os.makedirs(os.path.dirname(upload.partial_path), exist_ok=True)
+    open(upload.partial_path, 'wb').close()
+
+
+def append_chunk(upload, offset, stream, length):
+    """
+    Streams `length` bytes from `stream` into the partial file at `offset`, a small buffer at a time,
+    so the chunk is never held in memory. `offset` must be where the previous chunk ended.
+    """
+    if offset != upload.received_size:
+        raise OffsetMismatch()
+
+    read_size = settings.MEDIA_UPLOAD_READ_SIZE
+    written = 0
+    with open(upload.partial_path, 'r+b') as partial:
+        partial.seek(offset)
+        while written < length:
+            data = stream.read(min(read_size, length - written))
+            if not data:
+                break
+            partial.write(data)
+            written += len(data)
+
+    # Only move forward from the offset we started at, a concurrent retry of the same chunk loses here
+    updated = MediaUpload.objects.filter(pk=upload.pk, status='uploading', received_size=offset).update(
+        received_size=offset + written
+    )
+    if not updated:
+        raise OffsetMismatch()
+    upload.received_size = offset + written
+    return written
+
+
+def process_upload(upload_id):
+    # Runs on the worker queue: store the finished file and create its PostMedia row
+    upload = MediaUpload.objects.select_related('post__owner').get(pk=upload_id)
+    try:
+        media = PostMedia(post=upload.post)
+        with open(upload.partial_path, 'rb') as partial:
+            # Streams through the content-addressed store, which hashes it chunk by chunk
+            media.file.save(upload.filename, File(partial), save=False)
+
+        with transaction.atomic():
+            media.save()
+            MediaUpload.objects.filter(pk=upload.pk).update(status='done', media=media)
+    except Exception as exc:
+        logger.exception("Processing upload %s failed", upload_id)
+        MediaUpload.objects.filter(pk=upload.pk).update(status='failed', error=str(exc))
+    else:
+        os.remove(upload.partial_path)
+        process_post_media(media)
@@ -1,9 +1,11 @@
-from django.urls import path, include
+import re
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
 from .views import *
 from django.conf import settings
-from django.conf.urls.static import static
+from .media_serving import serve_media
+from .realtime import event_stream
 
 router = DefaultRouter()
 router.register(r'clubs', ClubViewSet)
@@ -12,18 +14,26 @@ router.register(r'clubadmins', ClubAdminViewSet)
 router.register(r'events', EventViewSet)
 router.register(r'feeds', FeedViewSet)
 router.register(r'posts', PostViewSet, basename='post')
+router.register(r'uploads', MediaUploadViewSet, basename='upload')
 router.register(r'follows', FollowViewSet)
 router.register(r'likes', LikeViewSet)
 router.register(r'comments', CommentViewSet)
 router.register(r'reservations', ReservationViewSet)
+router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api/register/', register, name='register'),
     path('api/userprofiles/me/', get_user_profile, name='get_user_profile'),
     path('api/userprofiles/<int:user_id>/', get_user_profile, name='get_user_profile_by_id'),
+    path('api/userprofiles/batch/', get_user_profiles_batch, name='get_user_profiles_batch'),
+    path('api/autocomplete/', autocomplete, name='autocomplete'),
+    path('api/recommendations/', get_recommendations, name='get_recommendations'),
+    path('api/search/', search_view, name='search'),
+    path('api/stream/', event_stream, name='event_stream'),
+    path('api/tags/trending/', get_trending_tags, name='get_trending_tags'),
+    path('api/tickets/validate/', validate_tickets, name='validate_tickets'),
     path('api/token/', obtain_auth_token, name='api_token_auth'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Range-aware media serving, see media_serving.py
+    re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$', serve_media, name='media'),
+]
@@ -1,5 +1,6 @@
 import json
-from rest_framework import viewsets, status
+import uuid
+from rest_framework import mixins, viewsets, status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.authentication import TokenAuthentication
@@ -7,28 +8,49 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.authtoken.models import Token
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from .models import *
 from .serializers import *
+from .autocomplete import name_index
+from .captions import process_caption
+from .follow_graph import is_following
+from .comment_tree import load_comment_tree
+from .like_buffer import like_buffer
+from .media_pipeline import process_post_media
+from .notifications import mark_read
+from .pagination import KeysetPagination
+from .recommendations import stored_recommendations
+from .search import search
+from .tags import attach_tags, resolve_tags
+from .profile_cache import (
+    cached_response, get_or_build, get_public_profiles, own_profile_key, public_profile_data, public_profile_key,
+)
+from .tickets import SoldOut, check_in_tickets, purchase_tickets, set_inventory_shards
+from .tasks import enqueue
+from .timeline import fan_out_post, read_timeline
+from .trending import record_post_tags, trending_tags
+from .uploads import OffsetMismatch, append_chunk, process_upload, start_upload
 
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def get_user_profile(request, user_id=None):
     # If the URL is for /me/, fetch the current user's profile
     if user_id is None or user_id == request.user.id:
+        if request.method == 'GET':
+            # Serve the authenticated user's profile from the cache, building it on a miss
+            entry = get_or_build(own_profile_key(request.user.id), lambda: build_own_profile(request.user))
+            if entry is None:
+                return Response({"error": "Profile not found"}, status=404)
+            return cached_response(request, entry)
+
         try:
             user_profile = UserProfile.objects.get(user=request.user)
 
-            if request.method == 'GET':
-                # Serialize and return profile data for the authenticated user
-                serializer = UserProfileSerializer(user_profile)
-                profile_data = serializer.data
-                profile_data['profile_pic_url'] = user_profile.get_profile_pic_url()
-                profile_data['cover_pic_url'] = user_profile.get_cover_pic_url()
-                profile_data['role_display_name'] = user_profile.get_role_display_name()
-                return Response(profile_data)
-
-            elif request.method == 'PATCH':
-                # Handle profile update (PATCH request)
+            if request.method == 'PATCH':
+                # Handle profile update (PATCH request), the post_save signal drops the cached copies
                 serializer = UserProfileSerializer(user_profile, data=request.data, partial=True)
                 if serializer.is_valid():
                     serializer.save()
@@ -39,19 +61,113 @@ def get_user_profile(request, user_id=None):
             return Response({"error": "Profile not found"}, status=404)
     
     # If the URL is for a different user profile (e.g. /api/userprofiles/21/)
+    if request.method == 'GET':
+        # Only return username and profile picture for other users
+        entry = get_or_build(public_profile_key(user_id), lambda: build_public_profile(user_id))
+        if entry is None:
+            return Response({"error": "Profile not found"}, status=404)
+        return cached_response(request, entry)
+
+
+def build_own_profile(user):
+    user_profile = UserProfile.objects.select_related('user').filter(user=user).first()
+    if user_profile is None:
+        return None
+    profile_data = dict(UserProfileSerializer(user_profile).data)
+    profile_data['profile_pic_url'] = user_profile.get_profile_pic_url()
+    profile_data['cover_pic_url'] = user_profile.get_cover_pic_url()
+    profile_data['role_display_name'] = user_profile.get_role_display_name()
+    return profile_data
+
+
+def build_public_profile(profile_id):
+    user_profile = UserProfile.objects.select_related('user').filter(id=profile_id).first()
+    return public_profile_data(user_profile) if user_profile else None
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def get_user_profiles_batch(request):
+    # Avatar hydration for lists: ?ids=1,2,3 or a JSON body {"ids": [...]} for long lists
+    if request.method == 'POST':
+        raw_ids = request.data.get('ids', [])
+    else:
+        raw_ids = request.query_params.get('ids', '').split(',')
+
     try:
-        user_profile = UserProfile.objects.get(id=user_id)
+        profile_ids = list(dict.fromkeys(int(profile_id) for profile_id in raw_ids if str(profile_id).strip()))
+    except (TypeError, ValueError):
+        return Response({"error": "ids must be a list of profile IDs"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(profile_ids) > settings.PROFILE_BATCH_LIMIT:
+        return Response(
+            {"error": f"At most {settings.PROFILE_BATCH_LIMIT} profiles per request"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        if request.method == 'GET':
-            # Only return username and profile picture for other users
-            profile_data = {
-                'username': user_profile.user.username,
-                'profile_pic_url': user_profile.get_profile_pic_url(),
-            }
-            return Response(profile_data)
-        
-    except UserProfile.DoesNotExist:
-        return Response({"error": "Profile not found"}, status=404)
+    profiles = get_public_profiles(profile_ids)
+    # Same shape as /api/userprofiles/<id>/ plus the id, unknown ids are left out
+    return Response([{'id': profile_id, **profiles[profile_id]} for profile_id in profile_ids if profile_id in profiles])
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_trending_tags(request):
+    # Top hashtags right now, served from a snapshot that is a few seconds old at most
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, settings.TRENDING_MAX_RESULTS))
+    return Response(trending_tags.top(limit))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_recommendations(request):
+    # ?type=user (people you may know, default) or ?type=club, precomputed by build_recommendations
+    kind = request.query_params.get('type', 'user')
+    if kind not in dict(Recommendation.KIND_CHOICES):
+        return Response({"error": "type must be user or club"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 20)), 50))
+    except ValueError:
+        return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(stored_recommendations(request.user.profile, kind, limit))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def autocomplete(request):
+    # Called on every keystroke: ?q=an&type=user answers from memory, user ids are profile ids
+    kinds = request.query_params.get('type', '').split(',') if request.query_params.get('type') else ('user', 'club')
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 8)), 20))
+    except ValueError:
+        return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(name_index.lookup(request.query_params.get('q', ''), limit, kinds))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_view(request):
+    # ?q=techno bog&type=club,event: ranked matches, the last word is matched as a prefix
+    kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+    if any(kind not in dict(SearchEntry.KIND_CHOICES) for kind in kinds):
+        return Response({"error": "type must be a comma-separated list of post, club and event"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        offset = max(0, int(request.query_params.get('offset', 0)))
+    except ValueError:
+        return Response({"error": "limit and offset must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # One extra row tells whether there is a next page
+    results = search(request.query_params.get('q', ''), kinds, limit + 1, offset)
+    next_url = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+    return Response({'next': next_url, 'results': results})
 
 
 @api_view(['POST'])
@@ -68,6 +184,31 @@ def register(request):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def validate_tickets(request):
+    # Door scanners sync a burst of QR codes for one club (and optionally one event) at a time
+    codes = request.data.get('codes')
+    if not isinstance(codes, list) or not codes or not all(isinstance(code, str) for code in codes):
+        return Response({"error": "codes must be a non-empty list of QR codes"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(codes) > settings.TICKET_SCAN_BATCH_LIMIT:
+        return Response(
+            {"error": f"At most {settings.TICKET_SCAN_BATCH_LIMIT} codes per request"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        club_id = uuid.UUID(str(request.data.get('club')))
+        event_id = uuid.UUID(str(request.data['event'])) if request.data.get('event') else None
+    except ValueError:
+        return Response({"error": "club and event must be valid IDs"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not (request.user.is_staff or ClubAdmin.objects.filter(user=request.user, club=club_id).exists()):
+        return Response({"error": "Only club admins can validate tickets"}, status=status.HTTP_403_FORBIDDEN)
+
+    return Response({'results': check_in_tickets(codes, club_id, event_id)})
+
+
 class ClubViewSet(viewsets.ModelViewSet):
     queryset = Club.objects.all()
     serializer_class = ClubSerializer
@@ -92,17 +233,73 @@ class EventViewSet(viewsets.ModelViewSet):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @action(detail=True, methods=['post'])
+    def purchase(self, request, pk=None):
+        event = self.get_object()
+        try:
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            quantity = 0
+        if not 1 <= quantity <= settings.TICKET_MAX_PER_PURCHASE:
+            return Response(
+                {"error": f"quantity must be between 1 and {settings.TICKET_MAX_PER_PURCHASE}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if event.date < timezone.now():
+            return Response({"error": "This event has already started"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            tickets = purchase_tickets(request.user, event, quantity)
+        except SoldOut:
+            return Response({"error": "Not enough tickets left"}, status=status.HTTP_409_CONFLICT)
+        return Response(TicketSerializer(tickets, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def inventory(self, request, pk=None):
+        # Switch the event between a single ticket counter (shards=0) and sharded buckets for flash sales
+        event = self.get_object()
+        if not (request.user.is_staff or event.created_by_id == request.user.id):
+            return Response({"error": "Only the event creator can change its inventory"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            shard_count = int(request.data.get('shards', 0))
+        except (TypeError, ValueError):
+            shard_count = -1
+        if not 0 <= shard_count <= settings.TICKET_MAX_SHARDS:
+            return Response(
+                {"error": f"shards must be between 0 and {settings.TICKET_MAX_SHARDS}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        event = set_inventory_shards(event, shard_count)
+        return Response(EventSerializer(event).data)
+
 class FeedViewSet(viewsets.ModelViewSet):
     queryset = Feed.objects.all()
     serializer_class = FeedSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        feed = self.get_object()
+        if feed.user_id != request.user.id:
+            return Response({"error": "You can only read your own timeline"}, status=status.HTTP_403_FORBIDDEN)
+
+        # The timeline merges two sources, so it only borrows the cursor format from the paginator
+        paginator = KeysetPagination()
+        paginator.request = request
+        posts, paginator.next_cursor = read_timeline(
+            feed, request.query_params.get(paginator.cursor_query_param), paginator.get_page_size(request)
+        )
+        serializer = PostSerializer(posts, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     parser_classes = (MultiPartParser, FormParser)
 
     def perform_create(self, serializer):
@@ -122,19 +319,28 @@ class PostViewSet(viewsets.ModelViewSet):
         # Handle tags if provided
         self.handle_tags(post)
 
+        # @mentions and #hashtags written in the caption
+        process_caption(post)
+
         # Optionally handle media upload separately if needed
         self.handle_media_upload(post)
+
+        # Push the new post into the followers' timelines
+        fan_out_post(post)
+
+        # Count its hashtags towards trending
+        record_post_tags(post)
         
     def get_queryset(self):
         user_id = self.kwargs.get('user_id', None)
         if user_id:
-            return Post.objects.filter(owner_id=user_id).order_by('-created_at')
-        return Post.objects.filter(owner=self.request.user).order_by('-created_at')
+            return Post.objects.for_serializer().filter(owner_id=user_id).order_by('-created_at')
+        return Post.objects.for_serializer().filter(owner=self.request.user).order_by('-created_at')
 
     @action(detail=False, methods=['get'], url_path='user/(?P<user_id>\d+)')
     def user_posts(self, request, user_id=None):
         # This action will be used for fetching posts of a specific user
-        posts = Post.objects.filter(owner_id=user_id).order_by('-created_at')
+        posts = Post.objects.for_serializer().filter(owner_id=user_id).order_by('-created_at')
         page = self.paginate_queryset(posts)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -143,11 +349,15 @@ class PostViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     def perform_update(self, serializer):
+        previous_caption = serializer.instance.caption
         post = serializer.save()
 
         # Handle tags if provided
         self.handle_tags(post)
 
+        # Only the mentions and hashtags that changed in the caption are written
+        process_caption(post, previous_caption)
+
         # Optionally handle media upload separately if needed
         self.handle_media_upload(post)
 
@@ -158,10 +368,8 @@ class PostViewSet(viewsets.ModelViewSet):
         if tags_data:
             try:
                 tags = json.loads(tags_data)  # Convert the string to a list of dictionaries
-                for tag_data in tags:
-                    tag, created = Tag.objects.get_or_create(name=tag_data['name'])
-                    post.tags.add(tag)
-            except json.JSONDecodeError:
+                attach_tags(post, resolve_tags(tag_data['name'] for tag_data in tags))
+            except (json.JSONDecodeError, TypeError, KeyError):
                 raise serializers.ValidationError({"tags": "Invalid tags format."})
 
     def handle_media_upload(self, post):
@@ -170,7 +378,8 @@ class PostViewSet(viewsets.ModelViewSet):
         if media_files:
             for media in media_files:
                 file_type = self.get_file_type(media.name)
-                PostMedia.objects.create(post=post, file=media, file_type=file_type)
+                post_media = PostMedia.objects.create(post=post, file=media, file_type=file_type)
+                process_post_media(post_media)
 
     def get_file_type(self, filename):
         ext = filename.split('.')[-1].lower()
@@ -183,23 +392,218 @@ class PostViewSet(viewsets.ModelViewSet):
         else:
             return 'other'
 
+class MediaUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads: POST to start, PUT raw bytes to chunk/?offset=N, POST finalize/.
+    GET on the upload returns received_size, which is where an interrupted client resumes.
+    """
+    serializer_class = MediaUploadSerializer
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return MediaUpload.objects.filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        upload = serializer.save(owner=self.request.user)
+        start_upload(upload)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        if upload.status != 'uploading':
+            return Response({"error": "This upload is already finalized"}, status=status.HTTP_409_CONFLICT)
+        try:
+            offset = int(request.query_params.get('offset', upload.received_size))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return Response({"error": "offset and Content-Length must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if length <= 0 or offset + length > upload.total_size:
+            return Response({"error": "Chunk is empty or goes past the declared file size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Read the raw request stream, request.data would buffer the whole body
+        try:
+            append_chunk(upload, offset, request.stream, length)
+        except OffsetMismatch:
+            upload.refresh_from_db()
+            return Response(
+                {"error": "Offset does not match the bytes received so far", 'received_size': upload.received_size},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        upload = self.get_object()
+        if upload.received_size != upload.total_size:
+            return Response(
+                {"error": "Upload is incomplete", 'received_size': upload.received_size},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not MediaUpload.objects.filter(pk=upload.pk, status='uploading').update(status='pending'):
+            return Response({"error": "This upload is already finalized"}, status=status.HTTP_409_CONFLICT)
+
+        # The worker creates the PostMedia row, the client polls the upload until it is done
+        enqueue(process_upload, upload.pk)
+        upload.refresh_from_db()
+        return Response(self.get_serializer(upload).data, status=status.HTTP_202_ACCEPTED)
+
 class FollowViewSet(viewsets.ModelViewSet):
     queryset = Follow.objects.all()
     serializer_class = FollowSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def perform_create(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise serializers.ValidationError({"error": "Already following."})
+
+    def parse_ids(self, name, cast=int):
+        raw = self.request.query_params.get(name, '')
+        return [cast(value) for value in raw.split(',') if value.strip()]
+
+    @action(detail=False, methods=['get'])
+    def check(self, request):
+        # ?users=1,2,3&clubs=4,5 (profile ids): whether the current user follows each of them
+        try:
+            user_ids, club_ids = self.parse_ids('users'), self.parse_ids('clubs')
+        except ValueError:
+            return Response({"error": "users and clubs must be lists of profile IDs"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) + len(club_ids) > settings.FOLLOW_CHECK_LIMIT:
+            return Response(
+                {"error": f"At most {settings.FOLLOW_CHECK_LIMIT} profiles per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        targets = [('user', user_id) for user_id in user_ids] + [('club', club_id) for club_id in club_ids]
+        followed = is_following(request.user.profile.id, targets)
+        return Response({
+            'users': {str(user_id): followed[('user', user_id)] for user_id in user_ids},
+            'clubs': {str(club_id): followed[('club', club_id)] for club_id in club_ids},
+        })
+
+    @action(detail=False, methods=['get'])
+    def followers(self, request):
+        # ?user=<profile id> or ?club=<club profile id>, newest followers first
+        try:
+            targets = {'following_user_id': self.parse_ids('user'), 'following_club_id': self.parse_ids('club')}
+        except ValueError:
+            return Response({"error": "user and club must be profile IDs"}, status=status.HTTP_400_BAD_REQUEST)
+        lookup = {field: ids[0] for field, ids in targets.items() if len(ids) == 1}
+        if len(lookup) != 1:
+            return Response({"error": "Pass exactly one of user or club"}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(Follow.objects.filter(**lookup))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 class LikeViewSet(viewsets.ModelViewSet):
     queryset = Like.objects.all()
     serializer_class = LikeSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_post_id(self, request):
+        try:
+            post_id = int(request.data.get('post') or request.query_params.get('post'))
+        except (ValueError, TypeError):
+            raise serializers.ValidationError({"post": "Invalid post ID."})
+        if not Post.objects.filter(pk=post_id).exists():
+            raise serializers.ValidationError({"post": "Invalid post ID."})
+        return post_id
+
+    def create(self, request, *args, **kwargs):
+        if not settings.LIKE_BUFFER_ENABLED:
+            return super().create(request, *args, **kwargs)
+
+        # Buffered path: accept now, written in bulk by the like buffer
+        post_id = self.get_post_id(request)
+        like_buffer.like(post_id, request.user.id)
+        return Response({'post': post_id, 'user': request.user.id, 'liked': True}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'])
+    def unlike(self, request):
+        post_id = self.get_post_id(request)
+        if settings.LIKE_BUFFER_ENABLED:
+            like_buffer.unlike(post_id, request.user.id)
+            return Response({'post': post_id, 'user': request.user.id, 'liked': False}, status=status.HTTP_202_ACCEPTED)
+
+        for like in Like.objects.filter(post_id=post_id, user=request.user):
+            like.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'], url_path='status')
+    def like_status(self, request):
+        # Merges the caller's buffered like/unlike so they see their own tap right away
+        post_id = self.get_post_id(request)
+        post = Post.objects.only('like_count').get(pk=post_id)
+        stored = Like.objects.filter(post_id=post_id, user=request.user).exists()
+        liked = like_buffer.pending_state(post_id, request.user.id)
+        like_count = post.like_count
+        if liked is None:
+            liked = stored
+        elif liked != stored:
+            like_count += 1 if liked else -1
+        return Response({'post': post_id, 'liked': liked, 'like_count': max(like_count, 0)})
 
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    @action(detail=False, methods=['get'], url_path='tree/(?P<post_id>\d+)')
+    def tree(self, request, post_id=None):
+        # Whole threads of a post, nested; ?roots=N&replies=K keeps the first N threads and K replies in each
+        limits = {}
+        for param in ('roots', 'replies'):
+            value = request.query_params.get(param)
+            if value is not None:
+                try:
+                    limits[param] = max(0, int(value))
+                except ValueError:
+                    return Response({"error": f"{param} must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        if not Post.objects.filter(pk=post_id).exists():
+            return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(load_comment_tree(post_id, limits.get('roots'), limits.get('replies')))
+
+class NotificationPagination(KeysetPagination):
+    ordering = ('timestamp', 'id')
+
+class NotificationViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    The current user's notifications, newest first; ?unread=true lists only the unread ones.
+    Rows are written by notifications.py, clients only read them and mark them read.
+    """
+    serializer_class = NotificationSerializer
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        notifications = Notification.objects.filter(user=self.request.user)
+        if self.action == 'list' and self.request.query_params.get('unread') == 'true':
+            notifications = notifications.filter(is_read=False)
+        return notifications
+
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        notification = self.get_object()
+        mark_read(request.user, [notification.pk])
+        notification.is_read = True
+        return Response(self.get_serializer(notification).data)
+
+    @action(detail=False, methods=['post'], url_path='read-all')
+    def read_all(self, request):
+        return Response({'updated': mark_read(request.user)})
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        count = UserProfile.objects.filter(user=request.user).values_list('unread_notifications', flat=True).first()
+        return Response({'unread': count or 0})
 
 class ReservationViewSet(viewsets.ModelViewSet):
     queryset = Reservation.objects.all()
@@ -13,4 +13,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'noctra_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from noctra_app.autocomplete import name_index  # noqa: E402
+from noctra_app.realtime import websocket_application  # noqa: E402
+
+# Loads the type-ahead index before the first keystroke
+name_index.warm()
+
+
+async def application(scope, receive, send):
+    # HTTP goes to Django, WebSockets to the push channel (see noctra_app/realtime.py)
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
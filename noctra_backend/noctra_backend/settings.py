@@ -13,6 +13,9 @@ SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'fallback-secret-key')
 # Media files
 MEDIA_URL = '/media/'  # The URL prefix for accessing media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # The absolute path to the media folder
+# Let the front server send media files: None, 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+MEDIA_OFFLOAD = os.getenv('DJANGO_MEDIA_OFFLOAD') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('DJANGO_MEDIA_ACCEL_PREFIX', '/protected-media/')  # nginx internal location
 
 # Static files
 STATIC_URL = '/static/'
@@ -50,6 +53,76 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Home timeline settings
+# Accounts with more followers than this are fanned out on read instead of on write
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.getenv('TIMELINE_FANOUT_MAX_FOLLOWERS', 1000))
+
+# Buffered likes: accept likes in memory and write them in bulk every few seconds
+LIKE_BUFFER_ENABLED = os.getenv('LIKE_BUFFER_ENABLED', 'False') == 'True'
+LIKE_BUFFER_FLUSH_INTERVAL = float(os.getenv('LIKE_BUFFER_FLUSH_INTERVAL', 1.0))
+
+# Notifications are merged in memory and written in bulk, see notifications.py
+NOTIFICATION_FLUSH_INTERVAL = float(os.getenv('NOTIFICATION_FLUSH_INTERVAL', 2.0))
+
+# Push to connected clients over /ws/ and /api/stream/, see realtime.py and pubsub.py.
+# The local broker only reaches clients of the same process: multi-worker deployments
+# point REALTIME_BROKER at a shared backend with the same interface.
+REALTIME_BROKER = os.getenv('REALTIME_BROKER', 'noctra_app.pubsub.LocalBroker')
+REALTIME_HEARTBEAT_SECONDS = 25
+REALTIME_MAX_QUEUED = 100  # messages held for a slow client before the oldest are dropped
+REALTIME_MAX_EVENTS = 20  # events whose ticket counts one connection can follow
+REALTIME_TICKETS_INTERVAL = 1.0  # seconds between ticket count pushes of a busy event
+
+# Trending hashtags, see trending.py (all values in seconds)
+TRENDING_HALF_LIFE = 3 * 60 * 60
+TRENDING_WINDOW = 24 * 60 * 60
+TRENDING_SNAPSHOT_SECONDS = 5
+TRENDING_RESYNC_SECONDS = 5 * 60
+TRENDING_MAX_RESULTS = 50
+
+# Follow graph, see follow_graph.py: follower ids of accounts with at least FOLLOW_GRAPH_HOT_THRESHOLD
+# followers are cached in memory, for up to FOLLOW_GRAPH_CACHE_SIZE accounts
+FOLLOW_GRAPH_HOT_THRESHOLD = 1000
+FOLLOW_GRAPH_CACHE_SIZE = 200
+FOLLOW_GRAPH_CACHE_SECONDS = 30
+FOLLOW_CHECK_LIMIT = 100  # profiles per /api/follows/check/ call
+
+# Username/club type-ahead, see autocomplete.py
+AUTOCOMPLETE_RESYNC_SECONDS = 10 * 60
+AUTOCOMPLETE_SCAN_LIMIT = 2000  # matches scanned per lookup, busier prefixes keep a top list instead
+
+# Ticket sales
+TICKET_MAX_PER_PURCHASE = 10
+TICKET_VALID_HOURS = 12  # how long after the event starts a ticket still gets you in
+TICKET_MAX_SHARDS = 64
+TICKET_SHARD_REFRESH_SECONDS = 2  # how stale the aggregated available_tickets of a sharded event may be
+TICKET_SCAN_BATCH_LIMIT = 1000  # QR codes per door-scanner sync
+
+# Background workers
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 2))
+BACKGROUND_TASKS_EAGER = os.getenv('BACKGROUND_TASKS_EAGER', 'False') == 'True'
+BACKGROUND_PROCESSES = int(os.getenv('BACKGROUND_PROCESSES', os.cpu_count() or 1))
+# Named queues with their own worker count, anything else shares BACKGROUND_WORKERS
+BACKGROUND_QUEUE_WORKERS = {
+    'transcode': int(os.getenv('VIDEO_TRANSCODE_WORKERS', os.cpu_count() or 1)),
+}
+
+# Image derivatives generated on upload (widths in px, formats in order of preference)
+IMAGE_DERIVATIVE_WIDTHS = [80, 320, 640, 1080]
+IMAGE_DERIVATIVE_FORMATS = ['avif', 'webp']
+IMAGE_DERIVATIVE_QUALITY = 75
+
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.getenv('FFPROBE_BINARY', 'ffprobe')
+# HLS ladder as (height, video bitrate, audio bitrate), rungs taller than the source are skipped
+VIDEO_HLS_RENDITIONS = [(360, '800k', '96k'), (720, '2800k', '128k'), (1080, '5000k', '192k')]
+VIDEO_HLS_SEGMENT_SECONDS = 6
+VIDEO_TRANSCODE_TIMEOUT = 60 * 60  # seconds per ffmpeg run
+
+# Chunked media uploads
+MEDIA_UPLOAD_MAX_SIZE = 1024 * 1024 * 1024  # 1 GB
+MEDIA_UPLOAD_READ_SIZE = 64 * 1024  # bytes read from the request per write
+
 # Middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -96,6 +169,25 @@ DATABASES = {
     }
 }
 
+# Cache: local memory by default, or a file cache shared by all workers when DJANGO_CACHE_DIR is set
+if os.getenv('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('DJANGO_CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'noctra',
+        }
+    }
+
+PROFILE_CACHE_TIMEOUT = 60 * 15
+PROFILE_BATCH_LIMIT = 300
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'noctra_backend.settings')
 
 application = get_wsgi_application()
+
+# Imported once Django is set up
+from noctra_app.autocomplete import name_index  # noqa: E402
+
+# Loads the type-ahead index before the first keystroke
+name_index.warm()